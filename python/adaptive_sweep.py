@@ -0,0 +1,210 @@
+# Script to choose the next runs of the sweep from the results of the runs already finished
+
+# Fits a Gaussian process surrogate of a steady state temperature against the sweep parameters,
+# using the runs in the script_maker manifest that have a result in the timeseries store,
+# with a length scale for each parameter and the noise fitted to the results by marginal likelihood,
+# then picks the candidate runs the surrogate is least sure about, counting the runs still queued as if they had run,
+# writes their .prm files, adds them to the manifest and permutations.csv and writes the slurm jobs of the batch (see slurm_jobs)
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import optimize
+import script_maker
+import slurm_jobs
+import sweep_design
+import timeseries_store
+
+def load_results(manifest_file, store_path, column):
+    # Parameters (runs x variables) and result of every run in the manifest that has finished,
+    # and the parameters of the runs in the manifest that have no result yet (queued or still running)
+    # column is a summary column of the store, e.g. 'T 100-200km R'
+    manifest = pd.read_csv(manifest_file)
+    variables = [name for name in manifest.columns if name.startswith('Variable_')]
+
+    summary = timeseries_store.load_summary(timeseries_store.load_store(store_path))
+    finished = manifest[manifest['Output Directory'].isin(summary.index)]
+    y = summary.loc[finished['Output Directory'], column].to_numpy()
+    keep = np.isfinite(y)
+    pending = manifest[~manifest['Output Directory'].isin(summary.index)]
+
+    return finished[variables].to_numpy(dtype=float)[keep], y[keep], pending[variables].to_numpy(dtype=float), manifest
+
+def surrogate_inputs(runs, n_variables, column=1):
+    # Inputs of the surrogate (runs x n_variables + 1), convection split into its speed and direction
+    # so slow runs in opposite directions are not treated as almost the same run
+    # runs may be empty, e.g. before any run has finished or once every run in the manifest has
+    runs = np.array(runs, dtype=float).reshape(len(runs), n_variables)
+    direction = np.sign(runs[:, column])
+    runs[:, column] = np.abs(runs[:, column])
+    return np.column_stack([runs, direction])
+
+def scale_inputs(X, bounds):
+    # Scale each variable to 0-1 over its (low, high) bounds so one length scale suits them all
+    low, high = bounds
+    return (X - low) / np.where(high > low, high - low, 1)
+
+# Hyperparameters used until there are enough finished runs to fit them, and the range they are fitted over
+LENGTH_SCALE = 0.4
+NOISE = 1e-2
+MIN_FIT = 5
+LENGTH_SCALE_BOUNDS = (0.05, 10.0)
+NOISE_BOUNDS = (1e-6, 1.0)
+
+def rbf_kernel(A, B, length_scales):
+    # Squared exponential covariance between two sets of scaled points, with a length scale for each variable
+    A = A / length_scales
+    B = B / length_scales
+    distance = np.sum(A**2, axis=1)[:, None] + np.sum(B**2, axis=1)[None, :] - 2 * A @ B.T
+    return np.exp(-0.5 * np.maximum(distance, 0))
+
+def negative_log_likelihood(log_parameters, X, y):
+    # Negative log marginal likelihood of standardised results y at scaled points X
+    # log_parameters are the log length scale of each variable then the log noise
+    length_scales = np.exp(log_parameters[:-1])
+    noise = np.exp(log_parameters[-1])
+    K = rbf_kernel(X, X, length_scales) + (noise + 1e-8) * np.eye(len(X))
+    try:
+        L = np.linalg.cholesky(K)
+    except np.linalg.LinAlgError:
+        return 1e10
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+    return 0.5 * y @ alpha + np.sum(np.log(np.diag(L))) + 0.5 * len(y) * np.log(2 * np.pi)
+
+def fit_hyperparameters(X, y, restarts=4, seed=0):
+    # Length scale of each variable and the noise that maximise the marginal likelihood of the finished runs
+    # X is scaled and y standardised, the search starts from the defaults and a few random points
+    n_variables = X.shape[1]
+    bounds = [tuple(np.log(LENGTH_SCALE_BOUNDS))] * n_variables + [tuple(np.log(NOISE_BOUNDS))]
+    low, high = np.array(bounds).T
+    rng = np.random.default_rng(seed)
+    starts = [np.append(np.full(n_variables, np.log(LENGTH_SCALE)), np.log(NOISE))] + list(rng.uniform(low, high, size=(restarts, len(low))))
+
+    best = None
+    for start in starts:
+        result = optimize.minimize(negative_log_likelihood, start, args=(X, y), method='L-BFGS-B', bounds=bounds)
+        if best is None or result.fun < best.fun:
+            best = result
+    return np.exp(best.x[:-1]), float(np.exp(best.x[-1]))
+
+def fit_gp(X, y, bounds, length_scales=None, noise=None):
+    # Fit a Gaussian process to the finished runs, y is standardised so noise is relative to its spread
+    # The length scales and noise are fitted to the results by marginal likelihood unless they are given
+    # (or there are fewer than MIN_FIT runs, when the defaults are used)
+    X = scale_inputs(X, bounds)
+    y_mean = y.mean() if len(y) else 0.0
+    y_std = y.std() if len(y) and y.std() > 0 else 1.0
+    y_scaled = (y - y_mean) / y_std
+
+    if length_scales is None:
+        if len(X) >= MIN_FIT:
+            length_scales, noise = fit_hyperparameters(X, y_scaled)
+        else:
+            length_scales, noise = LENGTH_SCALE, NOISE
+    length_scales = np.broadcast_to(np.asarray(length_scales, dtype=float), (X.shape[1],))
+    noise = NOISE if noise is None else noise
+
+    K = rbf_kernel(X, X, length_scales) + noise * np.eye(len(X))
+    L = np.linalg.cholesky(K)
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, y_scaled))
+
+    return {'X': X, 'L': L, 'alpha': alpha, 'bounds': bounds, 'length_scales': length_scales,
+            'noise': noise, 'y_mean': y_mean, 'y_std': y_std}
+
+def posterior_std(points, X, length_scales, noise):
+    # Standard deviation (in units of the standardised result) at scaled X of a Gaussian process conditioned on scaled points
+    if len(points) == 0:
+        return np.ones(len(X))
+    L = np.linalg.cholesky(rbf_kernel(points, points, length_scales) + noise * np.eye(len(points)))
+    v = np.linalg.solve(L, rbf_kernel(X, points, length_scales).T)
+    return np.sqrt(np.maximum(1 - np.sum(v**2, axis=0), 0))
+
+def predict_gp(model, X):
+    # Mean and standard deviation of the surrogate at X
+    X = scale_inputs(X, model['bounds'])
+    k = rbf_kernel(X, model['X'], model['length_scales'])
+    v = np.linalg.solve(model['L'], k.T)
+
+    mean = model['y_mean'] + model['y_std'] * (k @ model['alpha'])
+    variance = np.maximum(1 - np.sum(v**2, axis=0), 0)
+    return mean, model['y_std'] * np.sqrt(variance)
+
+def select_batch(model, pending, candidates, batch_size):
+    # Pick batch_size candidates one at a time, each the one the surrogate fitted to the finished runs is least sure about
+    # The uncertainty of a Gaussian process depends on the results only through its fitted length scales and noise,
+    # not on the results at the points it is conditioned on, so the runs queued but not finished (pending) and each pick
+    # are added as if they had been run before the next is chosen, which stops the batch landing on queued runs
+    # or bunching up in one corner of the parameter space
+    # pending and candidates are surrogate inputs, see surrogate_inputs
+    pending = np.asarray(pending, dtype=float).reshape(-1, candidates.shape[1])
+    points = np.vstack([model['X'], scale_inputs(pending, model['bounds'])])
+    scaled = scale_inputs(candidates, model['bounds'])
+    chosen = []
+    for _ in range(min(batch_size, len(candidates))):
+        std = posterior_std(points, scaled, model['length_scales'], model['noise'])
+        std[chosen] = -1
+        best = int(np.argmax(std))
+        chosen.append(best)
+        points = np.vstack([points, scaled[best]])
+    return chosen
+
+def candidate_runs(levels, manifest, design='full', design_options=None):
+    # Runs of a sweep design, both convection directions, that are not in the manifest yet
+    candidates = sweep_design.mirror_convection(sweep_design.make_design(design, levels, **(design_options or {})))
+    variables = [name for name in manifest.columns if name.startswith('Variable_')]
+    done = {tuple(run) for run in manifest[variables].to_numpy(dtype=float)}
+    return np.array([run for run in candidates.astype(float) if tuple(run) not in done])
+
+def next_batch(levels, manifest_file, permutations_file, store_path, output_dir, column, batch_size=32,
+               design='full', design_options=None, job_folder=None, prm_folder='.'):
+    # Write the next batch of runs and their slurm jobs, and return their (first, last) manifest index
+    # The jobs are written to job_folder (output_dir if None) by slurm_jobs.make_jobs, prm_folder is where they are on the cluster
+    X, y, pending, manifest = load_results(manifest_file, store_path, column)
+    candidates = candidate_runs(levels, manifest, design, design_options)
+    if len(candidates) == 0:
+        print("Every candidate run is already in the manifest")
+        return None
+
+    variables = [name for name in manifest.columns if name.startswith('Variable_')]
+    all_runs = surrogate_inputs(np.vstack([candidates, manifest[variables].to_numpy(dtype=float)]), len(variables))
+    bounds = (all_runs.min(axis=0), all_runs.max(axis=0))
+    X = surrogate_inputs(X, len(variables))
+
+    model = fit_gp(X, y, bounds)
+    if len(X):
+        mean, std = predict_gp(model, X)
+        print(f"Surrogate fitted to {len(X)} finished runs, largest misfit {np.abs(mean - y).max():.1f} K, "
+              f"length scales {np.round(model['length_scales'], 2)}, noise {model['noise']:.2g}")
+    print(f"{len(pending)} runs in the manifest have no result yet and are treated as pending")
+
+    chosen = select_batch(model, surrogate_inputs(pending, len(variables)), surrogate_inputs(candidates, len(variables)), batch_size)
+    permutations = [list(candidates[i]) for i in chosen]
+
+    start = int(manifest['Index'].max()) + 1 if len(manifest) else 1
+    results = script_maker.process_all(permutations, output_dir, start=start)
+    script_maker.write_manifest(manifest_file, permutations, results, start=start, append=True)
+    script_maker.write_to_csv(permutations_file, [[index] + perm for index, perm in enumerate(permutations, start=start)], append=True)
+
+    end = start + len(permutations) - 1
+    print(f"Wrote runs {start}-{end}")
+    slurm_jobs.make_jobs(manifest_file, output_dir if job_folder is None else job_folder, prm_folder=prm_folder,
+                         indices=range(start, end + 1))
+    return start, end
+
+def main():
+    levels = np.array(pd.read_csv(script_maker.input_file))
+    manifest_file = os.path.join(script_maker.output_dir, '..', 'manifest.csv')
+    permutations_file = os.path.join(script_maker.output_dir, '..', 'permutations.csv')
+    store_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\timeseries"
+
+    # result the surrogate is fitted to, a summary column of the timeseries store
+    column = 'T 100-200km R'
+    # number of runs in the next batch
+    batch_size = 32
+    # where the .prm files and task files are on the cluster, the job scripts of the batch are written next to the .prm files
+    prm_folder = "/nobackup/tkqk62/diss/code/v5_num_only"
+
+    next_batch(levels, manifest_file, permutations_file, store_path, script_maker.output_dir, column, batch_size, prm_folder=prm_folder)
+
+if __name__ == "__main__":
+    main()
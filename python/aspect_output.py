@@ -0,0 +1,167 @@
+# Readers for the index files ASPECT writes next to its graphical output
+
+# ASPECT keeps a solution.pvd (and solution.visit) in the output directory listing every output with its time
+# Reading these once per run gives the vtu files in time order with their real times,
+# rather than relying on the order os.listdir returns or on a hard coded time between outputs
+# The statistics and depth average tables ASPECT writes are read here too, each in one parse of the whole file
+
+import os
+import re
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+import vtu_reader
+
+def read_pvd(pvd_path):
+    # (time, file) of every dataset in a .pvd collection, the files are relative to the folder of the .pvd
+    folder = os.path.dirname(pvd_path)
+    entries = []
+    for dataset in ET.parse(pvd_path).getroot().iter('DataSet'):
+        entries.append((float(dataset.get('timestep')), os.path.normpath(os.path.join(folder, dataset.get('file')))))
+    return entries
+
+def read_visit(visit_path):
+    # (time, file) of every output in a .visit file, empty if it has no !TIME lines
+    folder = os.path.dirname(visit_path)
+    with open(visit_path) as file:
+        lines = [line.strip() for line in file if line.strip()]
+
+    times = [float(line.split()[1]) for line in lines if line.startswith('!TIME')]
+    n_blocks = 1
+    for line in lines:
+        if line.startswith('!NBLOCKS'):
+            n_blocks = int(line.split()[1])
+    files = [os.path.normpath(os.path.join(folder, line)) for line in lines if not line.startswith('!')]
+
+    if len(times) * n_blocks != len(files):
+        return []
+    # Each time has n_blocks files, only the first is kept and expanded back to all of its pieces below
+    return [(time, files[i * n_blocks]) for i, time in enumerate(times)]
+
+def pvtu_pieces(file_path):
+    # The vtu files that make up an output, a .pvtu lists its pieces and a .vtu is its own only piece
+    if not file_path.endswith('.pvtu'):
+        return [file_path]
+    folder = os.path.dirname(file_path)
+    return [os.path.join(folder, piece.get('Source')) for piece in ET.parse(file_path).getroot().iter('Piece')]
+
+def natural_key(file_path):
+    # Sort key that puts solution-00010 after solution-00009 whatever the zero padding
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', os.path.basename(file_path))]
+
+def timestep_index(run_folder, timestep=None):
+    # Sorted (time, vtu file) of every output of a run, run_folder is the ASPECT output directory
+    # The times come from solution.pvd, then solution.visit, then the TIME stored in each vtu file
+    # If none of those are there the files are sorted by name and spaced by timestep (years)
+    # Outputs listed in the index whose files are not there yet (a run still going) are left out
+    entries = []
+    pvd_path = os.path.join(run_folder, 'solution.pvd')
+    visit_path = os.path.join(run_folder, 'solution.visit')
+    if os.path.isfile(pvd_path):
+        entries = read_pvd(pvd_path)
+    if not entries and os.path.isfile(visit_path):
+        entries = read_visit(visit_path)
+
+    index = {}
+    for time, file_path in entries:
+        if not os.path.isfile(file_path):
+            continue
+        pieces = pvtu_pieces(file_path)
+        if len(pieces) != 1:
+            raise ValueError(f"{file_path} has {len(pieces)} pieces, run ASPECT with Number of grouped files = 1")
+        if os.path.isfile(pieces[0]):
+            index[time] = pieces[0]     # a restart can list a time twice, keep the last
+
+    if not index:
+        solution_folder = os.path.join(run_folder, 'solution')
+        file_paths = sorted((os.path.join(solution_folder, filename) for filename in os.listdir(solution_folder) if filename.endswith('.vtu')),
+                            key=natural_key)
+        for n, file_path in enumerate(file_paths):
+            try:
+                time = float(vtu_reader.VTUFile(file_path).get_field_data('TIME')[0])
+            except KeyError:
+                if timestep is None:
+                    raise ValueError(f"{file_path} has no TIME and there is no solution.pvd, give the time between outputs")
+                time = n * timestep
+            index[time] = file_path
+
+    return sorted(index.items())
+
+def times_and_files(index):
+    # Split a timestep index into an array of times and a list of files
+    return np.array([time for time, file_path in index]), [file_path for time, file_path in index]
+
+def header_column(line, columns):
+    # Add the column names in one header comment of an ASPECT table to columns
+    # statistics numbers its columns one per line, '# 2: Time (years)', depth average names them all on one line
+    numbered = re.match(r'#\s*\d+:\s*(.*)', line)
+    if numbered:
+        columns.append(numbered.group(1).strip())
+    else:
+        columns[:] = line.strip()[1:].split()
+    return columns
+
+def read_table(file_path):
+    # Every row of an ASPECT text table as a DataFrame with the header column names
+    # Cells that are not numbers (e.g. visualization file names) are nan
+    columns = []
+    with open(file_path, errors='ignore') as file:
+        for line in file:
+            if not line.startswith('#'):
+                break
+            header_column(line, columns)
+
+    table = pd.read_csv(file_path, sep=r'\s+', comment='#', header=None, names=columns, quotechar='"',
+                        skip_blank_lines=True, index_col=False)
+    return table.apply(pd.to_numeric, errors='coerce')
+
+def read_statistics(run_folder):
+    # The statistics file of a run, one row per timestep, e.g. table['Average temperature (K)']
+    return read_table(os.path.join(run_folder, 'statistics'))
+
+def read_depth_average(run_folder):
+    # The depth average output of a run, one row per (time, depth) with a column per averaged quantity
+    # None if the run has no depth average output
+    for file_name in ('depth_average.gnuplot', 'depth_average.txt'):
+        file_path = os.path.join(run_folder, file_name)
+        if os.path.isfile(file_path):
+            return read_table(file_path)
+    return None
+
+def zone_edges(depths):
+    # Top and bottom depth of each depth average zone from the zone centres ASPECT writes, (zones + 1) edges
+    # The zones are taken to meet halfway between their centres, with the first and last as thick as their neighbour
+    centres = np.unique(depths)
+    if len(centres) < 2:
+        return None
+    middles = (centres[1:] + centres[:-1]) / 2
+    return np.concatenate([[centres[0] - (middles[0] - centres[0])], middles, [centres[-1] + (centres[-1] - middles[-1])]])
+
+def bands_resolved(depths, bands, tolerance=0.01):
+    # True if the top and bottom of every (top, bottom) km band fall on zone edges of the depth average output,
+    # so each band is made of whole zones (within tolerance of a zone thickness)
+    edges = zone_edges(depths)
+    if edges is None:
+        return False
+    limits = np.array(bands, dtype=float).ravel() * 1000
+    gap = np.min(np.abs(limits[:, None] - edges[None, :]), axis=1)
+    return bool(np.all(gap <= tolerance * np.min(np.diff(edges))))
+
+def band_averages(times, depths, values, bands):
+    # Mean of values over each (top, bottom) km band at each output time, each zone weighted by how much of it is in the band
+    # times, depths and values are the columns of a depth average table
+    # Returns the output times and the band averages (bands x outputs), nan where a band overlaps no zones
+    output_times, output = np.unique(times, return_inverse=True)
+    averages = np.full((len(bands), len(output_times)), np.nan)
+    edges = zone_edges(depths)
+    if edges is None:
+        return output_times, averages
+    zone = np.searchsorted(np.unique(depths), depths)
+
+    for i, (top_depth, bottom_depth) in enumerate(bands):
+        overlap = np.clip(np.minimum(edges[1:], bottom_depth * 1000) - np.maximum(edges[:-1], top_depth * 1000), 0, None)
+        weights = overlap[zone]
+        total_weight = np.bincount(output, weights=weights, minlength=len(output_times))
+        total = np.bincount(output, weights=weights * values, minlength=len(output_times))
+        averages[i, total_weight > 0] = total[total_weight > 0] / total_weight[total_weight > 0]
+    return output_times, averages
@@ -0,0 +1,161 @@
+# Steady state maps of whole fields, for each run and across the ensemble of runs
+
+# Rather than reducing each timestep to a few averages, every point of the mesh is kept
+#   per run       time mean and variance of each field over the timesteps after the steady state onset of the run
+#   ensemble      mean and variance of the time mean maps of every run on the same mesh (runs of one x extent)
+# Both use Welford's running mean and variance, so each vtu file is read once and nothing is held for every timestep
+# The accumulators live in memory mapped .npy files and are updated a slice of points at a time,
+# so the memory used stays under memory_budget however many runs and timesteps there are
+# The onsets come from the timeseries store written by paraview_output_split_combine
+
+# Output, under output_path
+#   runs/<run name>/points.npy, <field>_mean.npy, <field>_var.npy, count.json
+#   ensemble/<x extent>km/points.npy, <field>_mean.npy, <field>_var.npy, runs.json
+
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import run_archive
+import steady_state
+import timeseries_store
+import paraview_output_split_combine
+
+class Welford:
+    # Running mean and variance of a field at every point, kept in memory mapped .npy files in folder
+
+    def __init__(self, folder, name, n_points, chunk_points):
+        self.folder = folder
+        self.name = name
+        self.count = 0
+        self.chunk_points = chunk_points
+        self.mean = open_memmap(os.path.join(folder, name + '_mean.npy'), mode='w+', dtype=np.float64, shape=(n_points,))
+        self.m2 = open_memmap(os.path.join(folder, name + '_m2.npy'), mode='w+', dtype=np.float64, shape=(n_points,))
+
+    def update(self, values):
+        # Add one sample of every point, a slice of chunk_points at a time
+        self.count += 1
+        for start in range(0, len(self.mean), self.chunk_points):
+            part = slice(start, start + self.chunk_points)
+            sample = np.asarray(values[part], dtype=np.float64)
+            delta = sample - self.mean[part]
+            self.mean[part] += delta / self.count
+            self.m2[part] += delta * (sample - self.mean[part])
+
+    def finish(self):
+        # Turn the sum of squares into the sample variance, <name>_var.npy, and close the files
+        m2_file = self.m2.filename
+        variance = open_memmap(os.path.join(self.folder, self.name + '_var.npy'), mode='w+', dtype=np.float64, shape=self.mean.shape)
+        for start in range(0, len(self.mean), self.chunk_points):
+            part = slice(start, start + self.chunk_points)
+            variance[part] = self.m2[part] / (self.count - 1) if self.count > 1 else np.nan
+        variance.flush()
+        self.mean.flush()
+        del self.m2
+        os.remove(m2_file)
+
+def chunk_points(memory_budget, n_points):
+    # Points per slice so the few float64 arrays of a slice in use at once fit in memory_budget,
+    # after the fields of the file being read (about one array per field)
+    return int(max(1024, min(n_points, memory_budget // (8 * 8))))
+
+def steady_onsets(store_path, column):
+    # Time (years) of the steady state onset of every run in the store, from one of its columns (e.g. 'T 100-200km R')
+    store = timeseries_store.load_store(store_path)
+    i = store['columns'].index(column)
+    values = np.asarray(store['values'][:, :, i])
+    onset, reached = steady_state.find_steady_state(values)
+    times = np.asarray(store['times'])
+    return {name: times[n, min(onset[n], store['lengths'][n] - 1)] for n, name in enumerate(store['runs'])}
+
+def run_field_statistics(name, main_folder_path, output_path, fields, onset_time, memory_budget=2**28, timestep=None):
+    # Time mean and variance maps of one run over its outputs from onset_time on, returns the run folder and x extent
+    index = [(time, file_path) for time, file_path in run_archive.timestep_index(os.path.join(main_folder_path, name), timestep)
+             if time >= onset_time]
+    if not index:
+        print(f"{name}: no outputs after the steady state onset")
+        return None
+
+    folder = os.path.join(output_path, 'runs', name)
+    os.makedirs(folder, exist_ok=True)
+    points = run_archive.open_output(index[0][1]).points
+    np.save(os.path.join(folder, 'points.npy'), points)
+
+    chunk = chunk_points(memory_budget, len(points))
+    accumulators = {field: Welford(folder, field, len(points), chunk) for field in fields}
+    for time, file_path in index:
+        vtufile = run_archive.open_output(file_path)
+        for field in fields:
+            accumulators[field].update(vtufile.get_point_field(field))
+        del vtufile
+
+    for accumulator in accumulators.values():
+        accumulator.finish()
+    with open(os.path.join(folder, 'count.json'), 'w') as file:
+        json.dump({'count': len(index), 'onset': float(onset_time), 'times': [float(time) for time, file_path in index]}, file)
+
+    print(f"{name}: {len(index)} outputs from {onset_time / 1e6:.0f} Myr")
+    return folder, float(points[:, 0].max())
+
+def ensemble_statistics(run_folders, output_path, fields, memory_budget=2**28):
+    # Mean and variance across runs of their time mean maps, one ensemble per mesh
+    # run_folders is a list of (folder, x extent) from run_field_statistics
+    meshes = {}
+    for folder, x_extent in run_folders:
+        meshes.setdefault(x_extent, []).append(folder)
+
+    for x_extent, folders in meshes.items():
+        ensemble = os.path.join(output_path, 'ensemble', f'{x_extent / 1000:.0f}km')
+        os.makedirs(ensemble, exist_ok=True)
+        points = np.load(os.path.join(folders[0], 'points.npy'), mmap_mode='r')
+        np.save(os.path.join(ensemble, 'points.npy'), points)
+
+        # Runs whose mesh differs (e.g. another refinement) are left out
+        same_mesh = [folder for folder in folders if np.load(os.path.join(folder, 'points.npy'), mmap_mode='r').shape == points.shape]
+        chunk = chunk_points(memory_budget, len(points))
+        for field in fields:
+            accumulator = Welford(ensemble, field, len(points), chunk)
+            for folder in same_mesh:
+                accumulator.update(np.load(os.path.join(folder, field + '_mean.npy'), mmap_mode='r'))
+            accumulator.finish()
+
+        with open(os.path.join(ensemble, 'runs.json'), 'w') as file:
+            json.dump([os.path.basename(folder) for folder in same_mesh], file, indent=1)
+        print(f"Ensemble of {len(same_mesh)} runs at {x_extent / 1000:.0f} km")
+
+def field_statistics(main_folder_path, store_path, output_path, fields, column, n_workers=1, memory_budget=2**28, timestep=None):
+    # Per run and ensemble steady state maps of every run in main_folder_path that is in the store
+    # memory_budget (bytes) is shared between the n_workers processes (None uses every core)
+    onsets = steady_onsets(store_path, column)
+    names = [name for name in paraview_output_split_combine.run_names(main_folder_path) if name in onsets]
+    worker_budget = memory_budget // (n_workers or os.cpu_count() or 1)
+
+    args = (names, repeat(main_folder_path), repeat(output_path), repeat(fields), [onsets[name] for name in names],
+            repeat(worker_budget), repeat(timestep))
+    if n_workers == 1:
+        run_folders = list(map(run_field_statistics, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            run_folders = list(executor.map(run_field_statistics, *args))
+
+    ensemble_statistics([run for run in run_folders if run is not None], output_path, fields, memory_budget)
+
+def main():
+    main_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\model outputs\v5"
+    output_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\\"
+    store_path = os.path.join(output_folder_path, 'timeseries')
+    output_path = os.path.join(output_folder_path, 'field_statistics')
+
+    # fields to map, and the column of the store whose steady state onset starts the averaging of each run
+    fields = ['T', 'viscosity']
+    column = 'T 100-200km R'
+    # memory the accumulators may use (bytes), shared between the processes
+    memory_budget = 2**30
+    n_workers = 4
+
+    field_statistics(main_folder_path, store_path, output_path, fields, column, n_workers, memory_budget)
+
+if __name__ == "__main__":
+    main()
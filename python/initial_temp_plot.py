@@ -1,60 +1,81 @@
-# just plotting the inital temp 
+# just plotting the inital temp
 # satoshi purkiss feb 2024
 
+# The profiles and maps come from initial_temperature, the same numbers script_maker writes to the .prm files
+# Every start temperature is worked out in one go, and one map is drawn for each distinct initial condition of the sweep
+
+import os
 import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import initial_temperature
 
-def main():
-    # Constants
-    p = 0.01
-    L = 15000000
-    pi = np.pi
-    k = 1
-    T0 = 0
-    h = 3000000
-    A = -0.0036666666666666666
-    B = 2450
-    C = -0.0045
-    D = 13499.999999999998
-    x = 0  # Assuming x is constant for this plot
-
-    output_dir = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\\"
-
-    # Function definition
-    def temperature(z):
-        
-        if z < 0.1 * h:
-            return T0 + A * z + B - p * np.cos(k * pi * x / L) * np.sin(pi * z / h)
-        elif z > 0.9 * h:
-            return T0 + C * z + D - p * np.cos(k * pi * x / L) * np.sin(pi * z / h)
-        else:
-            return T0 + 1350.0 - p * np.cos(k * pi * x / L) * np.sin(pi * z / h)
-
-    # Generate a range of z values
-    z_values = np.array(np.linspace(0, h, 500))
-    # z_values = np.flip(z_values)
-
-    # Calculate temperature for each z
-    temperatures = np.flip([temperature(z) for z in z_values])
-    
+def plot_profiles(start_heats, output_dir, T0=0):
+    # Temperature against depth for each mantle starting temperature on one plot
+    h = initial_temperature.H
+    z_values = np.linspace(0, h, 500)
+    temperatures = initial_temperature.profiles(start_heats, z_values, T0=T0)
 
     # Plotting
     fig, axs = plt.subplots()
-    # axs.figure(figsize=(8, 6))
-    axs.plot(temperatures, z_values/1000,color='red')
+    for start_heat, profile in zip(start_heats, temperatures):
+        # z is height above the bottom, depth is h - z
+        axs.plot(profile, (h - z_values)/1000, label=f'{start_heat:g} ºC' if len(start_heats) > 1 else None,
+                 color='red' if len(start_heats) == 1 else None)
     axs.set_xlabel('Temperature (ºC)')
     axs.set_ylabel('Depth (km)')
-    # axs.title('Initial Temperature Variation with Depth')
-    # axs.grid(True)
+    if len(start_heats) > 1:
+        axs.legend()
 
     axs.spines["top"].set_visible(False)
     axs.spines["right"].set_visible(False)
 
-    plt.gca().invert_yaxis()  # Invert y-axis to have depth increase downwards
-    plt.tight_layout()
-    # plt.show()    
-    plt.savefig(output_dir + 'initial temp variation with depth.png', format='png',dpi=300)
+    axs.invert_yaxis()  # Invert y-axis to have depth increase downwards
+    fig.tight_layout()
+    fig.savefig(os.path.join(output_dir, 'initial temp variation with depth.png'), format='png',dpi=300)
+    plt.close(fig)
+
+def plot_maps(initial_conditions, output_dir, nx=300, nz=150):
+    # Map of the initial temperature (K) over the box for each (x extent, start temperature)
+    # The fields of every start temperature of an x extent are worked out at once and drawn on one reused figure
+    fig, ax = plt.subplots(figsize=(10, 3))
+    image = None
+    for x_extent, group in initial_conditions.groupby('x_extent'):
+        start_heats = group['start_heat'].to_numpy()
+        fields, x, z = initial_temperature.grids(start_heats, x_extent, nx, nz)
+
+        for start_heat, field in zip(start_heats, fields):
+            if image is None:
+                image = ax.imshow(field, origin='lower', aspect='auto', cmap='inferno', vmin=initial_temperature.T_TOP, vmax=initial_temperature.T_BOTTOM)
+                fig.colorbar(image, ax=ax, label='Temperature (K)')
+                ax.set_xlabel('x (km)')
+                ax.set_ylabel('Height (km)')
+            image.set_data(field)
+            image.set_extent([0, x_extent/1000, 0, z[-1]/1000])
+            ax.set_title(f'{x_extent/1000:g} km, {start_heat:g} ºC')
+            fig.savefig(os.path.join(output_dir, f'initial temp {x_extent/1000:.0f}km {start_heat:g}C.png'), format='png', dpi=150)
+    plt.close(fig)
+
+def main():
+    output_dir = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\\"
+    # permutations written by script_maker, to draw the initial temperature of every run (None for the profile only)
+    permutations_file = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\permutations.csv"
+
+    # mantle starting temperatures (C) of the profile plot
+    start_heats = [1350.0]
+
+    if permutations_file is not None and os.path.isfile(permutations_file):
+        permutations = pd.read_csv(permutations_file)
+        # Variable_1 is the x extent and Variable_3 the start temperature, only these change the initial temperature
+        initial_conditions = permutations[['Variable_1', 'Variable_3']].drop_duplicates()
+        initial_conditions.columns = ['x_extent', 'start_heat']
+        start_heats = sorted(initial_conditions['start_heat'].unique())
+        plot_maps(initial_conditions, output_dir)
+
+    plot_profiles(start_heats, output_dir)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
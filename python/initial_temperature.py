@@ -0,0 +1,100 @@
+# Initial temperature field of the models, as set in the Initial temperature model of the script_maker template
+
+# z is the height above the bottom of the box, so the core/mantle boundary is z = 0 and the surface is z = h
+# The profile is linear from the bottom temperature to the mantle starting temperature over the bottom 10%,
+# constant through the interior and linear to the top temperature over the top 10%, less a small perturbation
+#   T(x, z) = T0 + A*z + B        z < 0.1h
+#             T0 + start_heat     0.1h <= z <= 0.9h
+#             T0 + C*z + D        z > 0.9h
+#             - p*cos(k*pi*x/L)*sin(pi*z/h)
+# Everything is numpy, so whole grids and batches of start temperatures are evaluated at once by broadcasting
+
+import re
+import numpy as np
+import pandas as pd
+
+H = 3000000         # height of model (m)
+T_TOP = 273         # temp at surface (K)
+T_BOTTOM = 2723     # temp at core/mantle boundary (K)
+T0 = 273            # offset of the function, start_heat is given in C
+P = 0.01            # size of the perturbation
+L = 15000000        # wavelength of the perturbation (m)
+K = 1
+
+def coefficients(start_heat, h=H, t_top=T_TOP, t_bottom=T_BOTTOM):
+    # A, B, C and D of the profile for a mantle starting temperature (C), a number or an array of them
+    # Worked out exactly as script_maker always has, so the values written to the .prm files don't change
+    Tmid = start_heat + 273     # intermediate start temp
+    z0 = 0                      # distance to core/mantle boundary
+    z1 = h * 0.1                # distance to 10% above core/mantle boundary
+    z2 = h * 0.9                # distance to 10% below surface
+    z3 = h                      # distance to surface
+    A = (t_bottom - Tmid)/(z0-z1)   # bottom gradient
+    B = (t_bottom - t_top)
+    C = (Tmid - t_top)/(z2-z3)      # top gradient
+    D = (t_top - C*z3 - t_top)
+    return A, B, C, D
+
+def temperature(x, z, start_heat, A=None, B=None, C=None, D=None, T0=T0, p=P, L=L, k=K, h=H):
+    # Initial temperature at (x, z), all of which broadcast together
+    # The coefficients are worked out from start_heat unless they are given (e.g. read from a .prm file)
+    if A is None:
+        A, B, C, D = coefficients(start_heat, h)
+    perturbation = p * np.cos(k * np.pi * x / L) * np.sin(np.pi * z / h)
+    return T0 - perturbation + np.where(z < 0.1 * h, A * z + B, np.where(z > 0.9 * h, C * z + D, start_heat))
+
+def profiles(start_heats, z, x=0, T0=T0):
+    # Temperature against z for each start temperature, (start temperatures x z)
+    start_heats = np.asarray(start_heats, dtype=float)[:, None]
+    return temperature(x, np.asarray(z, dtype=float)[None, :], start_heats, T0=T0)
+
+def grids(start_heats, x_extent, nx=200, nz=200, T0=T0):
+    # Temperature over the whole box for each start temperature, (start temperatures x nz x nx), with the x and z of the grid
+    x = np.linspace(0, x_extent, nx)
+    z = np.linspace(0, H, nz)
+    start_heats = np.asarray(start_heats, dtype=float)[:, None, None]
+    return temperature(x[None, None, :], z[None, :, None], start_heats, T0=T0), x, z
+
+def read_prm_constants(text):
+    # Constants of the initial temperature function in the text of a .prm file, with start_heat from its expression
+    # and the boundary temperatures, None where they are missing
+    values = {}
+    constants = re.search(r'set Function constants\s*=\s*(p=[^\n]*)', text)
+    if constants:
+        for item in constants.group(1).split(','):
+            name, _, value = item.partition('=')
+            values[name.strip()] = float(value)
+    start_heat = re.search(r'T0 \+ ([-+.\deE]+) - p\*cos', text)
+    values['start_heat'] = float(start_heat.group(1)) if start_heat else None
+    for side in ('Top', 'Bottom'):
+        boundary = re.search(rf'set {side} temperature\s*=\s*(\S+)', text)
+        values[side] = float(boundary.group(1)) if boundary else None
+    return values
+
+def validate_prm_files(file_paths, tolerance=1e-6):
+    # Check the initial temperature of every .prm file before it is submitted: the coefficients match
+    # the start temperature, the profile is continuous at 10% and 90% of the height and meets the boundary temperatures
+    # The files are parsed one by one and then every check is done for all of them at once
+    file_paths = list(file_paths)
+    rows = []
+    for file_path in file_paths:
+        with open(file_path) as file:
+            values = read_prm_constants(file.read())
+        rows.append([values.get(name, np.nan) for name in ('start_heat', 'A', 'B', 'C', 'D', 'T0', 'h', 'Top', 'Bottom')])
+    start_heat, A, B, C, D, t0, h, top, bottom = np.array(rows, dtype=float).reshape(-1, 9).T
+
+    expected = coefficients(start_heat, h, top, bottom)
+    coefficient_error = np.max(np.abs(np.array([A, B, C, D]) - np.array(expected)), axis=0)
+    # the perturbation is zero on the top and bottom boundaries
+    boundary_error = np.maximum(np.abs(t0 + B - bottom), np.abs(t0 + C * h + D - top))
+    jump = np.maximum(np.abs(A * 0.1 * h + B - start_heat), np.abs(C * 0.9 * h + D - start_heat))
+
+    checks = pd.DataFrame({
+        'File': file_paths,
+        'Start Heat': start_heat,
+        'Coefficient Error': coefficient_error,
+        'Boundary Error': boundary_error,
+        'Jump': jump,
+    })
+    checks['OK'] = (checks[['Coefficient Error', 'Boundary Error', 'Jump']] <= tolerance * np.maximum(1, np.abs(start_heat))[:, None]).all(axis=1)
+    return checks
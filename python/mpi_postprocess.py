@@ -0,0 +1,105 @@
+# The vtu reduction of paraview_output_split_combine spread over MPI ranks, across the nodes of a slurm job
+
+# Rank 0 hands out the runs one at a time and every other rank reduces a run, sends back its time series and asks for the next
+# A rank that finishes early just takes another run, so the load balances itself however uneven the runs are
+# The runs are handed out largest lateral extent first, so the heaviest runs are not the ones left at the end
+# Once every run is back rank 0 writes the summary, store, plots and spreadsheets as paraview_output_split_combine does
+# With a single rank (python mpi_postprocess.py or mpirun -n 1) rank 0 reduces every run itself
+
+# Run with
+#   mpirun -n 4 python mpi_postprocess.py <model outputs folder> <output folder>
+# or submit slurm/mpi_postprocess.slurm
+
+import sys
+import traceback
+from mpi4py import MPI
+import results_catalog
+import paraview_output_split_combine as pipeline
+
+WORK, RESULT, STOP = 1, 2, 3
+
+def run_cost(name):
+    # Lateral extent of a run from its folder name, the reduction of a run takes longer the wider it is
+    parsed = results_catalog.parse_run_name(name)
+    if parsed is None or not parsed[1]:
+        return 0.0
+    return parsed[1][0]
+
+def reduce_run(name, settings):
+    # Time series of one run, with the error instead if it failed, so a bad run never leaves a rank hanging
+    try:
+        return pipeline.process_run(name, *settings), None
+    except Exception:
+        return None, traceback.format_exc()
+
+def master(comm, names, settings):
+    # Hand the runs out to the worker ranks as they ask for them, and collect what they send back
+    # Returns the time series of each run, in the order of names
+    queue = sorted(names, key=run_cost, reverse=True)
+    results = {}
+    errors = {}
+
+    if comm.Get_size() == 1:
+        for name in queue:
+            results[name], errors[name] = reduce_run(name, settings)
+    else:
+        status = MPI.Status()
+        active = comm.Get_size() - 1
+        while active:
+            # None is a worker asking for its first run
+            message = comm.recv(source=MPI.ANY_SOURCE, tag=RESULT, status=status)
+            if message is not None:
+                name, series, error = message
+                results[name], errors[name] = series, error
+            if queue:
+                comm.send(queue.pop(0), dest=status.Get_source(), tag=WORK)
+            else:
+                comm.send(None, dest=status.Get_source(), tag=STOP)
+                active -= 1
+
+    failed = {name: error for name, error in errors.items() if error is not None}
+    if failed:
+        for name, error in failed.items():
+            print(f"{name} failed\n{error}")
+        raise RuntimeError(f"{len(failed)} of {len(names)} runs failed: {', '.join(sorted(failed))}")
+    return [results[name] for name in names]
+
+def worker(comm, settings):
+    # Reduce the runs rank 0 sends until it says stop
+    status = MPI.Status()
+    comm.send(None, dest=0, tag=RESULT)
+    while True:
+        name = comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+        if status.Get_tag() == STOP:
+            return
+        series, error = reduce_run(name, settings)
+        comm.send((name, series, error), dest=0, tag=RESULT)
+
+def mpi_postprocess(main_folder_path, output_folder_path, store_path, timestep, spec, index_dir=None, cache_dir=None,
+                    use_depth_average=False, read_ahead=2, make_plots=True, write_excel=True, comm=MPI.COMM_WORLD):
+    # Reduce every run of main_folder_path over the ranks of comm, and write the outputs on rank 0
+    # Every rank must call this, returns the run names and time series on rank 0 and None on the others
+    # the arguments of process_run after the run name, each rank reduces its runs on its own (executor None)
+    settings = (main_folder_path, timestep, spec, None, index_dir, cache_dir, use_depth_average, read_ahead)
+
+    if comm.Get_rank() != 0:
+        worker(comm, settings)
+        return None
+
+    names = pipeline.run_names(main_folder_path)
+    print(f"{len(names)} runs over {comm.Get_size()} ranks")
+    series = master(comm, names, settings)
+
+    # The plots are drawn on rank 0 alone, forking processes from an MPI rank is not safe under every MPI
+    pipeline.write_outputs(names, series, spec, output_folder_path, store_path, make_plots, write_excel, n_workers=1)
+    return names, series
+
+def main():
+    # the folders can be given on the command line, as on the cluster, everything else is set in paraview_output_split_combine.settings
+    config = pipeline.settings(*sys.argv[1:3])
+    mpi_postprocess(config['main_folder_path'], config['output_folder_path'], config['store_path'], config['timestep'], config['spec'],
+                    config['index_dir'], config['cache_dir'], config['use_depth_average'], config['read_ahead'], config['make_plots'],
+                    config['write_excel'])
+
+if __name__ == "__main__":
+    main()
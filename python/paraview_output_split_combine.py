@@ -3,95 +3,349 @@
 # This example specifically looks at plotting temperature against time
 # It then looks at the temperature of the upper mantle in the left and right side of the model 
 # and returns the steady state temperature for each side of the model as a excel spreadsheet
+# The full time series of every run are kept in a columnar store, see timeseries_store
+# Several depth bands, fields and regions are reduced together so every file is only read once
+# Full width ('all') reductions can be taken from ASPECT's depth average output, without reading any vtu files, for runs whose zones resolve the bands
+# Runs converted with run_archive are read from their archive in place of the vtu files
+# While a chunk of a run's files is reduced the next chunks are read ahead on background threads, to hide slow (network) reads
 
 # Satoshi Purkiss Jan 2024
 
 import os
-import vtuIO
 import numpy as np
+import region_index
+import reduction_cache
+import timeseries_store
+import steady_state
+import aspect_output
+import run_archive
+from time import perf_counter
+from collections import deque
+from functools import partial
+from itertools import repeat, islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
+import plot_renderer
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
-def find_index(gradient):
-    # Iterate through the gradient array
-    for i in range(25, len(gradient)):
-        # Check if the magnitude of the previous three values is less than 15
-        if np.all(np.abs(gradient[i-3:i]) < 15):
-            # print("gradient used")
-            return i -3  # Return the index of the first of these three values
-
-    return 25  # Return Value if no such index is found
-
-def process_vtu_files(input_folder, timestep,top_depth,bottom_depth):
-    # Iterate over all VTU files in the input folder
-    # Create an empty list to store rows
+def find_index(series):
+    # Index of the first timestep of the steady state of a series, see steady_state.find_steady_state
+    onset, reached = steady_state.find_steady_state(series)
+    return onset[0]
+
+def column_name(field, top_depth, bottom_depth, region):
+    # Name of one reduction, e.g. 'T 100-200km R'
+    return '{} {}-{}km {}'.format(field, top_depth, bottom_depth, region)
+
+def reduction_columns(spec):
+    # Names of the values produced by reduce_vtu_data, in the order they are returned
+    return [column_name(field, top_depth, bottom_depth, region)
+            for top_depth, bottom_depth in spec['bands'] for field in spec['fields'] for region in spec['regions']]
+
+def region_weights(spec, regions, point_weights=None):
+    # Sparse weight matrices of the regions in spec, see region_index.weight_matrix
+    # 'fixed' has a row for each band and region that is the same at every timestep, in band then region order
+    # 'band' has a row for each band, for the continent which moves with time
+    bands = [(top_depth*1000, bottom_depth*1000) for top_depth, bottom_depth in spec['bands']]
+    keys = [region_index.region_key(top_depth, bottom_depth, None if region == 'all' else region)
+            for top_depth, bottom_depth in bands for region in spec['regions'] if region != 'continent']
+    band_keys = [region_index.region_key(top_depth, bottom_depth) for top_depth, bottom_depth in bands]
+    return {'fixed': region_index.weight_matrix(regions, keys, point_weights),
+            'band': region_index.weight_matrix(regions, band_keys, point_weights)}
+
+def point_weights(vtufile, spec):
+    # Weight of each point in the region means, None for a plain mean of the points
+    # With spec['weights'] = 'area' each point is weighted by the area of the cells around it
+    if spec.get('weights') != 'area':
+        return None
+    connectivity, offsets, types = vtufile.get_cells()
+    return region_index.lumped_point_areas(vtufile.points, connectivity, offsets)
+
+def read_fields(vtufile, spec):
+    # The point fields of spec from a vtu file, and where the continent is if spec has that region
+    fields = {field: vtufile.get_point_field(field) for field in spec['fields']}
+    continent = vtufile.get_point_field('continent') >= 0.5 if 'continent' in spec['regions'] else None
+    return fields, continent
+
+def reduce_field_block(fields, continent, spec, weights):
+    # Average of every field in every region of every depth band, for a block of timesteps at once
+    # fields maps each field to a (timesteps x points) array and continent is (timesteps x points) or None
+    # Each field takes one sparse product for the fixed regions and one for the continent
+    # Returns (timesteps x reduction_columns(spec)), nan where a region is empty
+    fixed_regions = [region for region in spec['regions'] if region != 'continent']
+    n_timesteps = len(next(iter(fields.values())))
+    n_bands = len(spec['bands'])
+    averages = np.empty((n_timesteps, n_bands, len(spec['fields']), len(spec['regions'])))
+
+    fixed = weights['fixed']
+    fixed_total = np.asarray(fixed.sum(axis=1)).ravel()
+    if continent is not None:
+        continent = continent.astype(float)
+        continent_total = weights['band'] @ continent.T
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for f, field in enumerate(spec['fields']):
+            values = fields[field]
+            means = ((fixed @ values.T).T / fixed_total).reshape(n_timesteps, n_bands, len(fixed_regions))
+            for r, region in enumerate(spec['regions']):
+                if region == 'continent':
+                    averages[:, :, f, r] = ((weights['band'] @ (values * continent).T) / continent_total).T
+                else:
+                    averages[:, :, f, r] = means[:, :, fixed_regions.index(region)]
+
+    return averages.reshape(n_timesteps, -1)
+
+def reduce_vtu_data(vtufile, spec, regions=None, index_dir=None):
+    # Reduce a loaded vtu file to the average of every field in every region of every depth band in spec
+    # 'L' and 'R' are split at 2/3 of the model width, 'all' is the whole width of the band,
+    # 'continent' is where the continent composition is at least 0.5
+    # regions is the region index of the mesh, it is only looked up if missing or from a different mesh
+    bands = [(top_depth*1000, bottom_depth*1000) for top_depth, bottom_depth in spec['bands']] # convert depth ranges from km to m
+    if regions is None or regions['n_points'] != len(vtufile.points):
+        regions = region_index.get_region_index(vtufile.points, bands, index_dir)
+
+    fields, continent = read_fields(vtufile, spec)
+    weights = region_weights(spec, regions, point_weights(vtufile, spec))
+    return reduce_field_block({field: values[None, :] for field, values in fields.items()},
+                              None if continent is None else continent[None, :], spec, weights)[0].tolist()
+
+def reduce_vtu_file(file_path, spec, regions=None, index_dir=None):
+    # Reduce a single vtu file, see reduce_vtu_data
+    vtufile = run_archive.open_output(file_path)
+    return reduce_vtu_data(vtufile, spec, regions, index_dir)
+
+def load_vtu_fields(file_path, spec):
+    # The fields of spec from a vtu file read into memory, so the disk (or network) reads are all done here
+    # rather than later when the arrays of the memory map are first touched
+    fields, continent = read_fields(run_archive.open_output(file_path), spec)
+    return {field: np.array(values) for field, values in fields.items()}, continent
+
+def reduce_loaded(loaded, spec, weights):
+    # Reduce the loaded fields of several files of the same mesh, stacked and reduced together (see reduce_field_block)
+    fields = {field: np.vstack([file_fields[field] for file_fields, continent in loaded]) for field in spec['fields']}
+    continent = np.vstack([continent for file_fields, continent in loaded]) if 'continent' in spec['regions'] else None
+    return reduce_field_block(fields, continent, spec, weights).tolist()
+
+def load_vtu_chunk(file_paths, spec):
+    # The loaded fields of several vtu files, see load_vtu_fields
+    return [load_vtu_fields(file_path, spec) for file_path in file_paths]
+
+def reduce_vtu_chunk(file_paths, spec, weights):
+    # Reduce several vtu files of the same mesh, returns the values of each file
+    return reduce_loaded(load_vtu_chunk(file_paths, spec), spec, weights)
+
+def prefetch(load, items, depth):
+    # Generator of (load(item), seconds spent waiting for it) in the order of items
+    # Up to depth items are loaded ahead on background threads while the caller works on the current one,
+    # the queue of loads in flight is bounded so no more than depth + 1 results are held at once
+    # With depth 0 every item is loaded when it is asked for, so all of the load time is waiting
+    items = iter(items)
+    if depth < 1:
+        for item in items:
+            start = perf_counter()
+            result = load(item)
+            yield result, perf_counter() - start
+        return
+
+    with ThreadPoolExecutor(max_workers=depth) as threads:
+        queue = deque(threads.submit(load, item) for item in islice(items, depth))
+        while queue:
+            start = perf_counter()
+            result = queue.popleft().result()
+            waited = perf_counter() - start
+            queue.extend(threads.submit(load, item) for item in islice(items, 1))
+            yield result, waited
+
+def reduce_prefetched(chunks, spec, weights, read_ahead, timing):
+    # Reduce chunks of vtu files like reduce_vtu_chunk, while the next read_ahead chunks are read on background threads
+    # At most read_ahead + 1 chunks of loaded files are held at once, the one being reduced and those read ahead
+    # Yields the values of each chunk, and adds the time spent waiting on reads and reducing to timing
+    for block, waited in prefetch(partial(load_vtu_chunk, spec=spec), chunks, read_ahead):
+        timing['read'] += waited
+        start = perf_counter()
+        values = reduce_loaded(block, spec, weights)
+        timing['reduce'] += perf_counter() - start
+        yield values
+
+def process_vtu_files(timestep_index, spec, executor=None, index_dir=None, cache_file=None, save_every=10, chunk_size=16, read_ahead=2):
+    # Iterate over the (time, vtu file) of a run in time order, reading each file once for every reduction in spec
+    # Returns an array with the time in the first column and the reduction_columns(spec) after it
+    # The files are reduced chunk_size at a time, if an executor is given the chunks are reduced in parallel, map keeps them in order
+    # Otherwise the next read_ahead chunks are read on background threads while a chunk is reduced (0 reads each chunk when it is needed),
+    # so memory holds at most (read_ahead + 1) * chunk_size files, and the time spent waiting on reads and reducing is printed
+    # If a cache_file is given only new or changed files are read, and the cache is saved every save_every files
+    times, file_paths = aspect_output.times_and_files(timestep_index)
+    if not file_paths:
+        return np.empty((0, 1 + len(reduction_columns(spec))))
+
+    cache = reduction_cache.load_cache(cache_file, spec)
+    new_paths = [file_path for file_path in file_paths if reduction_cache.get_values(cache, file_path) is None]
+
+    if new_paths:
+        # The mesh is the same for every timestep, so the region index and the weight matrices are made once
+        # from the first file and handed to the reduction of every chunk
+        vtufile = run_archive.open_output(new_paths[0])
+        bands = [(top_depth*1000, bottom_depth*1000) for top_depth, bottom_depth in spec['bands']]
+        regions = region_index.get_region_index(vtufile.points, bands, index_dir)
+        weights = region_weights(spec, regions, point_weights(vtufile, spec))
+
+        chunks = [new_paths[i:i + chunk_size] for i in range(0, len(new_paths), chunk_size)]
+        timing = {'read': 0.0, 'reduce': 0.0}
+        if executor is None:
+            averages = reduce_prefetched(chunks, spec, weights, read_ahead, timing)
+        else:
+            averages = executor.map(reduce_vtu_chunk, chunks, repeat(spec), repeat(weights))
+
+        n_done = 0
+        for chunk, values in zip(chunks, averages):
+            for file_path, file_values in zip(chunk, values):
+                reduction_cache.set_values(cache, file_path, file_values)
+            if (n_done + len(chunk)) // save_every > n_done // save_every:
+                reduction_cache.save_cache(cache_file, spec, cache)
+            n_done += len(chunk)
+        reduction_cache.save_cache(cache_file, spec, cache)
+        if executor is None:
+            run_folder = os.path.dirname(os.path.dirname(new_paths[0]))
+            print(f"{os.path.basename(run_folder)}: {len(new_paths)} files, {timing['read']:.1f} s waiting on reads, {timing['reduce']:.1f} s reducing")
+
+    # Create a list to store rows
     rows = []
-
-    # convert depth ranges from km to m
-    top_depth = top_depth*1000
-    bottom_depth = bottom_depth*1000
-    n = 0
-    for filename in os.listdir(input_folder):
-        
-        if filename.endswith('.vtu'):
-            file_path = os.path.join(input_folder, filename)
-
-            vtufile = vtuIO.VTUIO(file_path,dim=2)
-
-            # Split the table into L and R based on the criteria
-            upper_mantle = (vtufile.points[:, 1] <= vtufile.points[:, 1].max() - top_depth) & (vtufile.points[:, 1] >= vtufile.points[:, 1].max() - bottom_depth)
-            condition = (vtufile.points[:, 0] <= (2 * vtufile.points[:, 0].max()) / 3) 
-
-            # # Calculate the average of X for L and R
-            avg_T_L = vtufile.get_point_field('T')[condition & upper_mantle].mean()
-            avg_T_R = vtufile.get_point_field('T')[~condition & upper_mantle].mean()
-
-            # Append the row to the list
-            rows.append([
-                n*timestep,
-                avg_T_L,
-                avg_T_R
-            ])
-            n += 1
+    for time, file_path in zip(times, file_paths):
+        rows.append([time] + reduction_cache.get_values(cache, file_path))
 
     return np.array(rows)
 
-def plot_and_save(df, input_folder_path, name,top_depth,bottom_depth):
-    # Extract x axis from the first column
-    x_axis = df[:, 0]/1e6 # converting from years to million years
-    y_axes = df[:, 1:]
-
-    # Plot each y axis over the x axis
-    average_n = []
-    fig, ax1 = plt.subplots()
-    for column in range(y_axes.shape[1]):
-        label = ["Oceanic", "Continental"][column % 2]  
-        label_colour = ["b", "orange"][column % 2]  
-        ax1.plot(x_axis, y_axes[:, column], label=label)
-
-        index = find_index(np.gradient(y_axes[:, column]))
-        average = np.mean(y_axes[index:, column])
-        average_n.append(average)
-        # print("{}: Average is {}".format(label, average))
-        ax1.axvline(x_axis[index],label=f"{label} Steady State Start",color=label_colour,linestyle="--")
-
-    # Add labels and legend
-    ax1.set_xlabel("Time (Million Years)")
-    ax1.set_ylabel('Temperature (K)')
-    ax1.set_ylim(500, 2500)
-
-    ax1.spines["top"].set_visible(False)
-    ax1.spines["right"].set_visible(False)
-    # ax1.set_title(name)
-    plt.legend(loc='upper left')
-
-    # Save the plot to the specified folder
-    outputfilepath = input_folder_path + name + f'_{top_depth}-{bottom_depth}km_plot.png'
-    plt.tight_layout()
-    plt.savefig(outputfilepath, format='png',dpi=300)
-    # plt.show()
-    plt.close()  # Clear the current figure
-    return average_n
+def band_folder(output_folder_path, top_depth, bottom_depth):
+    # Folder the plots and summary of one depth band are written to, with the separator on the end
+    return os.path.join(output_folder_path, f'{top_depth}-{bottom_depth}km', '')
+
+# Depth average column of each field that ASPECT can average, see depth_average_columns
+DEPTH_AVERAGE_FIELDS = {'T': 'temperature', 'viscosity': 'viscosity', 'continent': 'continent'}
+
+def depth_average_columns(run_folder, spec, output_times=None):
+    # The 'all' reductions of spec from the depth average output of a run, each zone weighted by its overlap with the band
+    # The table is only used if its zone edges fall on the band limits and it has output at least as often as
+    # the vtu files (output_times), otherwise the run falls back to the vtu files
+    # Returns the output times and a dict of column name to values for the fields the table has, empty if it can not be used
+    if 'all' not in spec['regions']:
+        return None, {}
+    table = aspect_output.read_depth_average(run_folder)
+    if table is None:
+        return None, {}
+
+    run = os.path.basename(os.path.normpath(run_folder))
+    if not aspect_output.bands_resolved(table['depth'].to_numpy(), spec['bands']):
+        print(f"{run}: depth average zones do not resolve the bands {spec['bands']}, reducing the vtu files instead")
+        return None, {}
+    times = np.unique(table['time'].to_numpy())
+    if output_times is not None and len(output_times) > 1 and (len(times) < 2 or np.max(np.diff(times)) > np.min(np.diff(output_times)) * 1.001):
+        print(f"{run}: depth average output is less frequent than the vtu output, reducing the vtu files instead")
+        return None, {}
+
+    columns = {}
+    for field in spec['fields']:
+        name = DEPTH_AVERAGE_FIELDS.get(field)
+        if name not in table.columns:
+            continue
+        times, averages = aspect_output.band_averages(table['time'].to_numpy(), table['depth'].to_numpy(),
+                                                      table[name].to_numpy(), spec['bands'])
+        for (top_depth, bottom_depth), values in zip(spec['bands'], averages):
+            columns[column_name(field, top_depth, bottom_depth, 'all')] = values
+    return times, columns
+
+def process_run(name, main_folder_path, timestep, spec, executor=None, index_dir=None, cache_dir=None, use_depth_average=False, read_ahead=2):
+    # Reduce one model run, returns its time series (see process_vtu_files)
+    # The outputs are read in time order, with their times taken from the solution.pvd of the run
+    # timestep (years) is only used to space the outputs if there is no record of their times
+    # With use_depth_average the 'all' reductions are taken from the depth average output of the run where it can stand in
+    # for the vtu files (see depth_average_columns), and the vtu files are only read if something in spec still needs them
+    run_folder = os.path.join(main_folder_path, name)
+    columns = reduction_columns(spec)
+    print('Working on {}'.format(name))
+
+    timestep_index = run_archive.timestep_index(run_folder, timestep)
+    output_times, file_paths = aspect_output.times_and_files(timestep_index)
+    times, averaged = depth_average_columns(run_folder, spec, output_times) if use_depth_average else (None, {})
+    if averaged and all(column in averaged for column in columns):
+        return np.column_stack([times] + [averaged[column] for column in columns])
+
+    # 'all' is left out of the vtu reduction if the depth averages have every field of it
+    vtu_spec = spec
+    if averaged and all(column in averaged for column in columns if column.endswith(' all')):
+        vtu_spec = dict(spec, regions=[region for region in spec['regions'] if region != 'all'])
+    cache_file = None if cache_dir is None else os.path.join(cache_dir, name + '.json')
+    df = process_vtu_files(timestep_index, vtu_spec, executor, index_dir, cache_file, read_ahead=read_ahead)
+    if not averaged:
+        return df
+
+    # Put the depth averages at the vtu output times and the columns back in the order of spec
+    vtu_columns = {column: df[:, 1 + i] for i, column in enumerate(reduction_columns(vtu_spec))}
+    return np.column_stack([df[:, 0]] + [np.interp(df[:, 0], times, averaged[column]) if column in averaged else vtu_columns[column]
+                                         for column in columns])
+
+def run_names(main_folder_path):
+    # Names of the model runs, the sorted folders of main_folder_path that have a solution folder or an archive (see run_archive)
+    return [name for name in sorted(os.listdir(main_folder_path))
+            if os.path.isdir(os.path.join(main_folder_path, name, 'solution')) or run_archive.has_archive(os.path.join(main_folder_path, name))]
+
+def process_all_runs(main_folder_path, timestep, spec, n_workers=None, parallel_timesteps=False, index_dir=None, cache_dir=None,
+                     use_depth_average=False, read_ahead=2):
+    # Fan the model runs out over a pool of n_workers processes (None uses every core)
+    # With parallel_timesteps the runs are walked one at a time and the vtu files of each run are spread over the pool instead,
+    # which is quicker when there are only a few runs with many timesteps
+    # Returns the run names and the time series of each run, in the sorted order of the run folders whichever way the work is split
+    names = run_names(main_folder_path)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        if parallel_timesteps:
+            series = [process_run(name, main_folder_path, timestep, spec, executor, index_dir, cache_dir, use_depth_average, read_ahead)
+                      for name in names]
+        else:
+            series = list(executor.map(process_run, names, repeat(main_folder_path), repeat(timestep), repeat(spec),
+                                       repeat(None), repeat(index_dir), repeat(cache_dir), repeat(use_depth_average), repeat(read_ahead)))
+
+    return names, series
+
+def summarise_runs(names, series, spec):
+    # Steady state average of the L and R temperature in each depth band, found for every run at once
+    # Returns the rows for the summary spreadsheet of each band and the steady state onset of each run (runs x 2),
+    # both keyed on (top_depth, bottom_depth)
+    columns = reduction_columns(spec)
+    lengths, times, values = timeseries_store.pad_series(series, len(columns))
+
+    all_data = {}
+    onsets = {}
+    for top_depth, bottom_depth in spec['bands']:
+        averages = []
+        band_onsets = []
+        for side, label in zip(('L', 'R'), plot_renderer.LABELS):
+            T = values[:, :, columns.index(column_name('T', top_depth, bottom_depth, side))]
+            onset, reached = steady_state.find_steady_state(T)
+            averages.append(steady_state.steady_state_mean(T, onset))
+            band_onsets.append(onset)
+
+            for name in np.array(names)[~reached]:
+                print(f"{name}: {label} {top_depth}-{bottom_depth}km never reached steady state, averaging from timestep {steady_state.MIN_START}")
+
+        all_data[(top_depth, bottom_depth)] = [[name, average_L, average_R] for name, average_L, average_R in zip(names, *averages)]   # for plotting both L and R
+        onsets[(top_depth, bottom_depth)] = np.column_stack(band_onsets)
+
+    return all_data, onsets
+
+def plot_jobs(names, series, onsets, spec, output_folder_path):
+    # Jobs for plot_renderer.render_plots, one plot of the L and R temperature for each depth band of each run
+    columns = reduction_columns(spec)
+    jobs = []
+    for top_depth, bottom_depth in spec['bands']:
+        T_columns = [1 + columns.index(column_name('T', top_depth, bottom_depth, side)) for side in ('L', 'R')]
+        for name, df, onset in zip(names, series, onsets[(top_depth, bottom_depth)]):
+            x_axis = df[:, 0]/1e6 # converting from years to million years
+            outputfilepath = band_folder(output_folder_path, top_depth, bottom_depth) + name + f'_{top_depth}-{bottom_depth}km_plot.png'
+            jobs.append((x_axis, df[:, T_columns], onset, outputfilepath))
+
+    return jobs
 
 def plot_and_save_cum_r(df, output_folder_path, name,top_depth,bottom_depth):
     # Extract x axis from the first column
@@ -101,7 +355,7 @@ def plot_and_save_cum_r(df, output_folder_path, name,top_depth,bottom_depth):
     fig, ax2 = plt.subplots()
     ax2.plot(x_axis, y_axis, label=name)
 
-    index = find_index(np.gradient(y_axis))
+    index = find_index(y_axis)
     average = np.mean(y_axis[index:]) 
     # print("R: Average is {}".format(average))
 
@@ -129,33 +383,82 @@ def write_data_to_excel(filename, data):
 
     print(f"Data written to {filename}")
 
+def write_outputs(names, series, spec, output_folder_path, store_path, make_plots=True, write_excel=True, n_workers=None):
+    # Steady state summary of every run, saved to the store with the time series, with the plots and spreadsheets
+    # n_workers is the number of processes the plots are spread over (None uses every core, 1 draws them here)
+    for top_depth, bottom_depth in spec['bands']:
+        os.makedirs(band_folder(output_folder_path, top_depth, bottom_depth), exist_ok=True)
+
+    all_data, onsets = summarise_runs(names, series, spec)
+
+    # Save the time series and steady state averages of every run to the store
+    summary_columns = [column_name('T', top_depth, bottom_depth, side) for top_depth, bottom_depth in spec['bands'] for side in ('L', 'R')]
+    summary = [[all_data[band][i][side] for band in spec['bands'] for side in (1, 2)] for i in range(len(names))]
+    timeseries_store.write_store(store_path, names, series, reduction_columns(spec), summary, summary_columns)
+
+    if make_plots:
+        plot_renderer.render_plots(plot_jobs(names, series, onsets, spec, output_folder_path), n_workers)
+
+    if not write_excel:
+        return
+
+    # Write the data of each depth band to a single Excel file at the end
+    for top_depth, bottom_depth in spec['bands']:
+        final_excel_filename = os.path.join(band_folder(output_folder_path, top_depth, bottom_depth), "summary.xlsx")
+        write_data_to_excel(final_excel_filename, all_data[(top_depth, bottom_depth)])
+
+def settings(main_folder_path=None, output_folder_path=None):
+    # The settings of a reduction of every run, shared by main and mpi_postprocess.main so the two always agree
+    # The folders default to the ones below, the cluster gives its own on the command line
+    timestep = None     # time between outputs (years), only needed if the runs have no solution.pvd and no TIME in their files
+    if main_folder_path is None:
+        main_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\model outputs\v5"
+    if output_folder_path is None:
+        output_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\\"#remember \\ on the end
+
+    # define the reductions done on every file, each file is only read once for all of them
+    spec = {
+        'bands': [(100, 200), (200, 400)],                                   # ranges of depths that will be plot (km)
+        'fields': ['T', 'viscosity', 'melt_fraction', 'strain_rate'],       # T must be included for the plots
+        'regions': ['L', 'R', 'continent', 'all'],                          # L and R must be included for the plots
+        'weights': None,                                                    # 'area' weights each point by the area of the cells around it
+    }
+
+    # number of processes to use, None uses every core on the machine (mpi_postprocess uses its ranks instead)
+    n_workers = None
+    # spread the timesteps of each run over the processes instead of the runs themselves
+    parallel_timesteps = False
+    # where the region index of each mesh is saved so reruns don't recompute it
+    index_dir = os.path.join(output_folder_path, 'region_index')
+    # where the reduced values of every file are cached, reruns only read new or changed files
+    # and an interrupted job carries on where it stopped, set to None to read everything again
+    cache_dir = os.path.join(output_folder_path, 'reduction_cache')
+    # take the 'all' region from ASPECT's depth average output, rather than from the vtu files, for the runs whose
+    # depth average zones resolve the bands (Number of zones = 30 in the template, older runs have 10) and which have
+    # output at least as often as the vtu files, every other run is reduced from its vtu files and says so
+    use_depth_average = False
+    # number of chunks of vtu files (16 files each) each run reads ahead on background threads while the last one is reduced,
+    # which hides the wait on a network filesystem such as /nobackup (0 reads each chunk when it is needed)
+    read_ahead = 2
+    # where the full time series of every run are saved, load them with timeseries_store.load_store
+    store_path = os.path.join(output_folder_path, 'timeseries')
+    # also write the summary of each depth band as an Excel spreadsheet
+    write_excel = True
+    # plot every run, set to False for a quick data only sweep
+    make_plots = True
+
+    return {'timestep': timestep, 'main_folder_path': main_folder_path, 'output_folder_path': output_folder_path, 'spec': spec,
+            'n_workers': n_workers, 'parallel_timesteps': parallel_timesteps, 'index_dir': index_dir, 'cache_dir': cache_dir,
+            'use_depth_average': use_depth_average, 'read_ahead': read_ahead, 'store_path': store_path,
+            'write_excel': write_excel, 'make_plots': make_plots}
+
 def main():
-    timestep = 20000000
-    main_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\model outputs\v5"
-    output_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\100-200_big_T_range\\"#remember \\ on the end
-
-    all_data = []
-
-    # define the range of depths that will be plot 
-    top_depth = 100    #km
-    bottom_depth = 200 #km
-
-    # Iterate over each subfolder in the main folder
-    for name in os.listdir(main_folder_path):
-        subfolder_path = os.path.join(main_folder_path, name, 'solution')
-        if os.path.isdir(subfolder_path):
-            print('Working on {}-{}km depth in {}'.format(top_depth,bottom_depth,name))
-            df = process_vtu_files(subfolder_path, timestep,top_depth,bottom_depth)
-            average_n = plot_and_save(df, output_folder_path, name,top_depth,bottom_depth)
-            # Append the folder name and averages to the list
-            all_data.append([name, average_n[0], average_n[1]])   # for plotting both L and R
-
-            # Plot cumulative graph of only right hand side values
-            # plot_and_save_cum_r(df, output_folder_path, name,top_depth,bottom_depth)
-
-    # Write all data to a single Excel file at the end
-    final_excel_filename = os.path.join(output_folder_path, "summary.xlsx")
-    write_data_to_excel(final_excel_filename, all_data)
+    config = settings()
+    names, series = process_all_runs(config['main_folder_path'], config['timestep'], config['spec'], config['n_workers'],
+                                     config['parallel_timesteps'], config['index_dir'], config['cache_dir'],
+                                     config['use_depth_average'], config['read_ahead'])
+    write_outputs(names, series, config['spec'], config['output_folder_path'], config['store_path'], config['make_plots'],
+                  config['write_excel'], config['n_workers'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,84 @@
+# Batch rendering of the temperature against time plots of every run
+
+# Each process builds one figure with the axes, labels and legend already set up,
+# then for every plot only the line data and steady state markers are changed before saving
+# The plots are shared out over a pool of processes so the PNG encoding runs in parallel
+
+import matplotlib
+matplotlib.use('Agg')   # no windows are ever shown, render straight to PNG
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+
+LABELS = ["Oceanic", "Continental"]
+COLOURS = ["b", "orange"]
+
+class LinePlotRenderer:
+    # Reusable figure for the L and R temperature of one depth band against time
+
+    def __init__(self, dpi=300):
+        self.dpi = dpi
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        ax1 = self.fig.add_subplot()
+
+        # Same artists and legend order as one plot per figure, each line followed by its steady state marker
+        self.lines = []
+        self.onset_lines = []
+        for label, label_colour in zip(LABELS, COLOURS):
+            self.lines.append(ax1.plot([], [], label=label)[0])
+            self.onset_lines.append(ax1.axvline(0, label=f"{label} Steady State Start", color=label_colour, linestyle="--"))
+
+        # Add labels and legend
+        ax1.set_xlabel("Time (Million Years)")
+        ax1.set_ylabel('Temperature (K)')
+        ax1.set_ylim(500, 2500)
+
+        ax1.spines["top"].set_visible(False)
+        ax1.spines["right"].set_visible(False)
+        ax1.legend(loc='upper left')
+
+        self.ax1 = ax1
+        self.laid_out = False
+
+    def render(self, x_axis, y_axes, onset, output_file_path):
+        # Swap in the data of one run and save it, x_axis is in million years and y_axes is (timesteps x 2)
+        for column, (line, onset_line) in enumerate(zip(self.lines, self.onset_lines)):
+            line.set_data(x_axis, y_axes[:, column])
+            if onset[column] < len(x_axis):
+                onset_line.set_xdata([x_axis[onset[column]]] * 2)
+                onset_line.set_visible(True)
+            else:
+                onset_line.set_visible(False)
+
+        self.ax1.relim()
+        self.ax1.autoscale_view(scaley=False)
+
+        # The layout only depends on the labels, so it is worked out for the first plot and kept
+        if not self.laid_out:
+            self.fig.tight_layout()
+            self.laid_out = True
+
+        self.fig.savefig(output_file_path, format='png', dpi=self.dpi)
+
+# Renderer of this process, made on first use
+_renderer = None
+
+def render_plot(job):
+    # Render one (x_axis, y_axes, onset, output_file_path) job with the renderer of this process
+    global _renderer
+    if _renderer is None:
+        _renderer = LinePlotRenderer()
+    _renderer.render(*job)
+
+def render_plots(jobs, n_workers=None, chunksize=8):
+    # Render every job, spread over n_workers processes (None uses every core, 1 renders here)
+    if n_workers == 1:
+        for job in jobs:
+            render_plot(job)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        # list() so any error in a worker is raised here
+        list(executor.map(render_plot, jobs, chunksize=chunksize))
@@ -0,0 +1,59 @@
+# Cache of the reduced values of every vtu file
+
+# Each run has its own json cache file holding the values reduce_vtu_data returned for each vtu file,
+# along with the size and modification time of the file when it was read
+# Reruns only read files that are new or have changed, and the cache is saved as the files are worked
+# through so an interrupted job carries on where it stopped
+# The cache is thrown away if the reduction spec changes
+
+import os
+import json
+import hashlib
+import run_archive
+
+def spec_key(spec):
+    # Hash of the reduction spec, the cache is only valid for the spec it was made with
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+def file_stamp(file_path):
+    # Size and modification time of a file, if either changes the file is read again
+    # An archived output has no file of its own and is stamped with the index of its archive
+    stat = os.stat(run_archive.stamp_file(file_path))
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_cache(cache_file, spec):
+    # Load the cached values of a run, empty if there is no cache or it was made with another spec
+    if cache_file is None or not os.path.isfile(cache_file):
+        return {}
+
+    with open(cache_file) as file:
+        try:
+            saved = json.load(file)
+        except ValueError:
+            return {}
+
+    if saved.get('spec') != spec_key(spec):
+        return {}
+    return saved['files']
+
+def save_cache(cache_file, spec, cache):
+    # Save the cached values of a run, through a temporary file so a crash never leaves half a cache
+    if cache_file is None:
+        return
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump({'spec': spec_key(spec), 'files': cache}, file)
+    os.replace(tmp_file, cache_file)
+
+def get_values(cache, file_path):
+    # Cached values of a file, None if the file has not been read or has changed since
+    entry = cache.get(os.path.abspath(file_path))
+    if entry is None or entry['stamp'] != file_stamp(file_path):
+        return None
+    return entry['values']
+
+def set_values(cache, file_path, values):
+    # Add the values of a file to the cache
+    cache[os.path.abspath(file_path)] = {'stamp': file_stamp(file_path), 'values': [float(value) for value in values]}
@@ -0,0 +1,95 @@
+# Index of the mesh points that fall in each region of the model
+
+# ASPECT is run with global refinement only, so every timestep of a run shares the same mesh
+# The points in each depth band and side of the model are found once per mesh, keyed on a hash
+# of the point coordinates, and saved to disk so reruns can skip the comparisons entirely
+# weight_matrix turns the index into a sparse (regions x points) matrix, so the mean of every region over
+# many timesteps is one sparse product, with the points optionally weighted by the area of the cells around them
+
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+
+# Region indices already found in this process, keyed on (mesh hash, depth bands)
+_region_cache = {}
+
+def mesh_key(points):
+    # Hash of the point coordinates, identical meshes give identical keys
+    return hashlib.sha1(np.ascontiguousarray(points).tobytes()).hexdigest()
+
+def region_key(top_depth, bottom_depth, side=None):
+    # Name of a region in the index, side is 'L', 'R' or None for the whole width of the band
+    key = 'band_{}_{}'.format(top_depth, bottom_depth)
+    if side is not None:
+        key += '_' + side
+    return key
+
+def compute_region_index(points, bands):
+    # Split the points of each depth band into L and R, the bands are (top_depth, bottom_depth) in m
+    surface = points[:, 1].max()
+    condition = (points[:, 0] <= (2 * points[:, 0].max()) / 3)
+
+    regions = {'n_points': len(points)}
+    for top_depth, bottom_depth in bands:
+        upper_mantle = (points[:, 1] <= surface - top_depth) & (points[:, 1] >= surface - bottom_depth)
+        regions[region_key(top_depth, bottom_depth)] = np.flatnonzero(upper_mantle)
+        regions[region_key(top_depth, bottom_depth, 'L')] = np.flatnonzero(condition & upper_mantle)
+        regions[region_key(top_depth, bottom_depth, 'R')] = np.flatnonzero(~condition & upper_mantle)
+
+    return regions
+
+def get_region_index(points, bands, index_dir=None):
+    # Return the region index for this mesh, from memory, then disk, and only then by computing it
+    bands = tuple(tuple(band) for band in bands)
+    key = (mesh_key(points), bands)
+    if key in _region_cache:
+        return _region_cache[key]
+
+    index_file = None
+    if index_dir is not None:
+        band_names = '_'.join('{}-{}'.format(top_depth, bottom_depth) for top_depth, bottom_depth in bands)
+        index_file = os.path.join(index_dir, '{}_{}.npz'.format(key[0], band_names))
+
+    if index_file is not None and os.path.isfile(index_file):
+        with np.load(index_file) as saved:
+            regions = {name: saved[name] for name in saved.files}
+        regions['n_points'] = int(regions['n_points'])
+    else:
+        regions = compute_region_index(points, bands)
+        if index_file is not None:
+            # Write to a temporary file first so parallel workers never read a half written index
+            os.makedirs(index_dir, exist_ok=True)
+            tmp_file = index_file + '.{}.tmp'.format(os.getpid())
+            with open(tmp_file, 'wb') as file:
+                np.savez(file, **regions)
+            os.replace(tmp_file, index_file)
+
+    _region_cache[key] = regions
+    return regions
+
+def lumped_point_areas(points, connectivity, offsets):
+    # Area of the mesh around each point, every cell shares its area equally between its corners
+    # connectivity and offsets are the cells of the vtu file (see vtu_reader.VTUFile.get_cells)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = np.concatenate([[0], offsets[:-1]])
+    sizes = offsets - starts
+
+    areas = np.zeros(len(points))
+    for size in np.unique(sizes):
+        corners = np.asarray(connectivity)[starts[sizes == size][:, None] + np.arange(size)]    # (cells x corners)
+        x = points[corners, 0]
+        y = points[corners, 1]
+        # shoelace formula, corners are in order around each cell
+        cell_areas = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+        areas += np.bincount(corners.ravel(), weights=np.repeat(cell_areas / size, size), minlength=len(points))
+    return areas
+
+def weight_matrix(regions, keys, point_weights=None):
+    # Sparse (keys x points) matrix with the weight of each point of the region named by each key,
+    # 1 for every point or point_weights (e.g. lumped_point_areas) if given
+    # The mean of a (timesteps x points) field F over each region is (W @ F.T) / W.sum(axis=1)
+    rows = np.concatenate([np.full(len(regions[key]), row) for row, key in enumerate(keys)] + [np.zeros(0, dtype=np.int64)])
+    columns = np.concatenate([regions[key] for key in keys] + [np.zeros(0, dtype=np.int64)])
+    data = np.ones(len(columns)) if point_weights is None else np.asarray(point_weights, dtype=float)[columns]
+    return sparse.csr_matrix((data, (rows, columns)), shape=(len(keys), regions['n_points']))
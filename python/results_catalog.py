@@ -0,0 +1,87 @@
+# Catalog of every run of the sweep, indexed by run ID
+
+# Joins what is known about each run in memory, rather than by copying results into a spreadsheet by hand
+#   run folders       the ASPECT output directory names, which encode the index and parameters of the run
+#   manifest.csv      the index, .prm file, output directory and parameters written by script_maker
+#   timeseries store  the steady state averages of each run written by paraview_output_split_combine
+# Run folder names look like v5_467__30000000_0__L0_01__1400__1__100000, fields split by '__',
+# with '_' for '.' and 'L' for '-' in the parameters (see script_maker.output_name)
+
+import os
+import numpy as np
+import pandas as pd
+import timeseries_store
+
+# Names and scales of the manifest variables as scatter_maker plots them, extents and thicknesses in km
+VARIABLES = {
+    'Variable_1': ('Lateral Extent', 1e-3),
+    'Variable_2': ('Convection Velocity', 1),
+    'Variable_3': ('Mantle Interior Starting Temperature', 1),
+    'Variable_4': ('Continental Crust Internal Heat Production', 1),
+    'Variable_5': ('Continental Crust Thickness', 1e-3),
+}
+
+def parse_run_name(name):
+    # Run ID and parameters of a run folder name, None if it is not one
+    fields = os.path.basename(os.path.normpath(name)).split('__')
+    prefix, _, index = fields[0].rpartition('_')
+    if not prefix or not index.isdigit():
+        return None
+    try:
+        parameters = [float(field.replace('L', '-').replace('_', '.')) for field in fields[1:]]
+    except ValueError:
+        return None
+    return int(index), parameters
+
+def runs_from_folders(names):
+    # Table of the runs in a list of folder names, indexed by run ID, with their parameters parsed from the names
+    rows = {}
+    for name in names:
+        parsed = parse_run_name(name)
+        if parsed is not None:
+            index, parameters = parsed
+            rows[index] = [name] + parameters
+
+    n_variables = max((len(row) - 1 for row in rows.values()), default=0)
+    columns = ['Output Directory'] + [f'Variable_{i+1}' for i in range(n_variables)]
+    catalog = pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+    catalog.index.name = 'Run ID'
+    return catalog.sort_index()
+
+def build_catalog(manifest_file=None, store_path=None, main_folder_path=None):
+    # Every run known from the manifest, the run folders in main_folder_path and the runs in the store,
+    # indexed by run ID, with its parameters and steady state results
+    # Any of the sources can be left out (None)
+    names = []
+    if main_folder_path is not None:
+        names += [name for name in os.listdir(main_folder_path) if os.path.isdir(os.path.join(main_folder_path, name))]
+
+    summary = None
+    if store_path is not None:
+        store = timeseries_store.load_store(store_path)
+        if store['summary'] is not None:
+            summary = timeseries_store.load_summary(store)
+        names += list(store['runs'])
+    folders = runs_from_folders(names)
+
+    if manifest_file is not None:
+        manifest = pd.read_csv(manifest_file).set_index('Index')
+        manifest.index.name = 'Run ID'
+        # Runs only known from their folder name (e.g. made before the manifest) are added on the end
+        catalog = pd.concat([manifest, folders.loc[folders.index.difference(manifest.index)]])
+    else:
+        catalog = folders
+
+    if summary is not None:
+        catalog = catalog.join(summary, on='Output Directory')
+    return catalog.sort_index()
+
+def analysis_table(catalog, result_columns=None):
+    # The catalog with the variable names and units scatter_maker uses
+    # result_columns maps store summary columns to new names, e.g. {'T 100-200km R': 'R values 100-200km'}
+    table = catalog.copy()
+    for variable, (name, scale) in VARIABLES.items():
+        if variable in table:
+            table[name] = table.pop(variable) * scale
+    table = table.rename(columns=result_columns or {})
+    return table.replace([np.inf, -np.inf], np.nan)
@@ -0,0 +1,203 @@
+# Compact archive of the graphical output of a run
+
+# ASPECT writes every output as a full precision vtu file with the mesh repeated in each one
+# The archive keeps the mesh once and each field as one float32 (timesteps x points) array, so a run takes several
+# times less space and a reanalysis reads a few contiguous arrays instead of every vtu file
+# Uncompressed fields are .npy files that are memory mapped, so a timestep is read straight off the disk without a decode
+# With compress the .npy files go into a zip (fields.npz), smaller again but each field is decompressed whole when first used
+
+# Layout, in the run folder next to (or instead of) the solution folder
+#   archive/index.json    times, the vtu file name of each output and the fields
+#   archive/mesh.npz      points, connectivity, offsets and types of the cells
+#   archive/<field>.npy   or archive/fields.npz with compress
+
+# An output of an archive is named like the vtu file it came from, e.g. <run>/archive/solution-00012.0000.vtu
+# timestep_index and open_output take those names as well as real vtu files, so the reduction and plotting code
+# reads an archived run as if its vtu files were still there
+
+import os
+import json
+import shutil
+import zipfile
+from functools import lru_cache
+import numpy as np
+from numpy.lib.format import open_memmap
+import vtu_reader
+import aspect_output
+
+ARCHIVE_FOLDER = 'archive'
+
+def archive_folder(run_folder):
+    return os.path.join(run_folder, ARCHIVE_FOLDER)
+
+def has_archive(run_folder):
+    return os.path.isfile(os.path.join(archive_folder(run_folder), 'index.json'))
+
+def archive_run(run_folder, timestep=None, fields=None, compress=False, remove=False):
+    # Write the archive of a run from its vtu files, one file at a time so memory stays at one output
+    # fields defaults to every point field of the first output, with remove the solution folder is deleted
+    # once the archive is written
+    # Returns the size of the vtu files and of the archive (bytes)
+    index = aspect_output.timestep_index(run_folder, timestep)
+    if not index:
+        raise ValueError(f"{run_folder} has no outputs to archive")
+
+    # The mesh is copied out of the first file, so no memory map of the vtu files is left open to stop them being deleted
+    first = vtu_reader.VTUFile(index[0][1], dim=3)
+    fields = first.point_field_names if fields is None else fields
+    points = np.array(first.points)
+    connectivity, offsets, types = (np.array(array) for array in first.get_cells())
+    first.close()
+    n_points = len(points)
+
+    # Written to a temporary folder and moved into place, so a half written archive is never read
+    folder = archive_folder(run_folder)
+    tmp_folder = folder + '.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+
+    np.savez(os.path.join(tmp_folder, 'mesh.npz'), points=points, connectivity=connectivity, offsets=offsets, types=types)
+    arrays = {field: open_memmap(os.path.join(tmp_folder, field + '.npy'), mode='w+', dtype=np.float32, shape=(len(index), n_points))
+              for field in fields}
+
+    vtu_size = 0
+    for n, (time, file_path) in enumerate(index):
+        vtufile = vtu_reader.VTUFile(file_path, dim=3)
+        file_points = len(vtufile.points)
+        if file_points == n_points:
+            for field in fields:
+                arrays[field][n] = vtufile.get_point_field(field)
+        vtufile.close()
+        if file_points != n_points:
+            del arrays
+            shutil.rmtree(tmp_folder)
+            raise ValueError(f"{file_path} has {file_points} points, not {n_points}, the mesh must be the same at every output")
+        vtu_size += os.path.getsize(file_path)
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    if compress:
+        with zipfile.ZipFile(os.path.join(tmp_folder, 'fields.npz'), 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for field in fields:
+                archive.write(os.path.join(tmp_folder, field + '.npy'), field + '.npy')
+                os.remove(os.path.join(tmp_folder, field + '.npy'))
+
+    with open(os.path.join(tmp_folder, 'index.json'), 'w') as file:
+        json.dump({'times': [time for time, file_path in index], 'names': [os.path.basename(file_path) for time, file_path in index],
+                   'fields': list(fields), 'compressed': compress}, file, indent=1)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    archive_size = sum(os.path.getsize(os.path.join(folder, filename)) for filename in os.listdir(folder))
+
+    # Every vtu file has been closed, so a failure to delete them is a real error and is raised
+    if remove:
+        shutil.rmtree(os.path.join(run_folder, 'solution'))
+    return vtu_size, archive_size
+
+@lru_cache(maxsize=4)
+def load_archive(folder, stamp):
+    # The index, mesh and fields of an archive, kept open for the outputs of the run that follow
+    # stamp (see archive_stamp) is part of the cache key, so a rewritten archive is loaded again
+    with open(os.path.join(folder, 'index.json')) as file:
+        index = json.load(file)
+    with np.load(os.path.join(folder, 'mesh.npz')) as mesh:
+        index['mesh'] = dict(mesh)
+    index['positions'] = {name: n for n, name in enumerate(index['names'])}
+    if index['compressed']:
+        index['npz'] = np.load(os.path.join(folder, 'fields.npz'))
+        index['arrays'] = {}
+    else:
+        index['arrays'] = {field: np.load(os.path.join(folder, field + '.npy'), mmap_mode='r') for field in index['fields']}
+    return index
+
+def archive_stamp(folder):
+    # Size and modification time of the index of an archive, it is rewritten whenever the archive is
+    stat = os.stat(os.path.join(folder, 'index.json'))
+    return (stat.st_size, stat.st_mtime_ns)
+
+def field_array(archive, field):
+    # (timesteps x points) array of a field, a compressed field is decompressed the first time it is asked for
+    if field not in archive['arrays']:
+        if field not in archive['fields']:
+            raise KeyError(field)
+        archive['arrays'][field] = archive['npz'][field]
+    return archive['arrays'][field]
+
+class ArchiveOutput:
+    # One output of an archived run, with the points/get_point_field interface of vtu_reader.VTUFile
+
+    def __init__(self, file_path, dim=2):
+        self.file_path = file_path
+        self.dim = dim
+        folder = os.path.dirname(file_path)
+        self._archive = load_archive(folder, archive_stamp(folder))
+        self._n = self._archive['positions'][os.path.basename(file_path)]
+
+    @property
+    def points(self):
+        return self._archive['mesh']['points'][:, :self.dim]
+
+    @property
+    def point_field_names(self):
+        return list(self._archive['fields'])
+
+    def get_point_field(self, name):
+        return field_array(self._archive, name)[self._n]
+
+    def get_field_data(self, name):
+        if name != 'TIME':
+            raise KeyError(name)
+        return np.array([self._archive['times'][self._n]])
+
+    def get_cells(self):
+        mesh = self._archive['mesh']
+        return mesh['connectivity'], mesh['offsets'], mesh['types']
+
+def is_archived(file_path):
+    # Whether a file path names an output of an archive rather than a vtu file
+    return os.path.basename(os.path.dirname(file_path)) == ARCHIVE_FOLDER and not os.path.isfile(file_path)
+
+def open_output(file_path, dim=2):
+    # Reader of one output, whether it is a vtu file or in an archive
+    if is_archived(file_path):
+        return ArchiveOutput(file_path, dim)
+    return vtu_reader.VTUFile(file_path, dim=dim)
+
+def stamp_file(file_path):
+    # The file whose size and modification time stand for an output, the index of its archive if it is archived
+    if is_archived(file_path):
+        return os.path.join(os.path.dirname(file_path), 'index.json')
+    return file_path
+
+def timestep_index(run_folder, timestep=None):
+    # Sorted (time, output) of a run, from its archive if it has one and otherwise its vtu files (see aspect_output.timestep_index)
+    if not has_archive(run_folder):
+        return aspect_output.timestep_index(run_folder, timestep)
+    folder = archive_folder(run_folder)
+    archive = load_archive(folder, archive_stamp(folder))
+    return [(time, os.path.join(folder, name)) for time, name in zip(archive['times'], archive['names'])]
+
+def main():
+    main_folder_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\model outputs\v5"
+    # fields to keep (None keeps them all), zip the fields, and delete the vtu files once a run is archived
+    fields = ['T', 'viscosity', 'continent', 'density', 'strain_rate', 'melt_fraction']
+    compress = False
+    remove = False
+    timestep = None     # time between outputs (years), only needed if the runs have no solution.pvd and no TIME in their files
+
+    total_vtu, total_archive = 0, 0
+    for name in sorted(os.listdir(main_folder_path)):
+        run_folder = os.path.join(main_folder_path, name)
+        if not os.path.isdir(os.path.join(run_folder, 'solution')):
+            continue
+        vtu_size, archive_size = archive_run(run_folder, timestep, fields, compress, remove)
+        total_vtu += vtu_size
+        total_archive += archive_size
+        print(f"{name}: {vtu_size / 2**20:.1f} MB of vtu files to {archive_size / 2**20:.1f} MB")
+    print(f"All runs: {total_vtu / 2**20:.1f} MB to {total_archive / 2**20:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,52 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.lines as mlines
-from scipy.stats import linregress
-
-def calculate_rms(values):
-    """Calculate the Root Mean Square of a given set of values."""
-    return np.sqrt(np.mean(np.square(values)))
-
-def scatter_plot(x_axis, y_axis_dict, depth_labels, var, variables, output_dir, conv_direction, rms_values_dict, std_values_dict, rms_data, var_unit):
+import results_catalog
+
+def convection_direction(convection):
+    # 'Positive' or 'Negative' for each convection velocity, None for runs without convection
+    return pd.Series(np.where(convection > 0, 'Positive', np.where(convection < 0, 'Negative', None)), index=convection.index)
+
+def stats_table(df, variables, y_axes, depth_labels):
+    # RMS, standard deviation and count of the temperatures at every level of every variable,
+    # for each convection direction and depth range, with the linear fit through the RMS values of each variable
+    # One grouped pass over a long table, no Python callbacks per group
+    directions = ['Positive', 'Negative']
+    base = df[variables + y_axes].assign(**{'Direction': convection_direction(df['Convection Velocity'])})
+
+    # One row per (run, variable, depth range), with the level of the variable in that run
+    long = base.melt(id_vars=['Direction'] + y_axes, value_vars=variables, var_name='Variable', value_name='X Value')
+    long = long.melt(id_vars=['Direction', 'Variable', 'X Value'], value_vars=y_axes, var_name='Depth Label', value_name='T')
+    long['Depth Label'] = long['Depth Label'].map(dict(zip(y_axes, depth_labels)))
+    long['T2'] = long['T']**2
+
+    # Categories keep the groups in the order of variables, directions and depth_labels
+    long['Variable'] = pd.Categorical(long['Variable'], categories=variables)
+    long['Direction'] = pd.Categorical(long['Direction'], categories=directions)
+    long['Depth Label'] = pd.Categorical(long['Depth Label'], categories=depth_labels)
+
+    keys = ['Depth Label', 'Variable', 'Direction', 'X Value']
+    stats = long.groupby(keys, observed=True, sort=True).agg(
+        **{'Mean Square': ('T2', 'mean'), 'Standard Deviation': ('T', 'std'), 'Count': ('T', 'count')}).reset_index()
+    stats['RMS Value'] = np.sqrt(stats.pop('Mean Square'))
+
+    # Least squares line through the RMS values of each series, from its sums
+    x = stats['X Value']
+    y = stats['RMS Value']
+    sums = pd.DataFrame({'n': 1.0, 'x': x, 'y': y, 'xx': x * x, 'xy': x * y, 'yy': y * y})
+    sums = sums.groupby([stats['Depth Label'], stats['Variable'], stats['Direction']], observed=True).transform('sum')
+    sxx = sums['n'] * sums['xx'] - sums['x']**2
+    sxy = sums['n'] * sums['xy'] - sums['x'] * sums['y']
+    syy = sums['n'] * sums['yy'] - sums['y']**2
+    stats['Slope'] = sxy / sxx.where(sxx > 0)
+    stats['Intercept'] = (sums['y'] - stats['Slope'] * sums['x']) / sums['n']
+    stats['R Squared'] = sxy**2 / (sxx * syy).where((sxx > 0) & (syy > 0))
+
+    stats = stats.rename(columns={'Direction': 'Convection Velocity'})
+    return stats[['Depth Label', 'Variable', 'Convection Velocity', 'X Value', 'RMS Value', 'Standard Deviation',
+                  'Count', 'Slope', 'Intercept', 'R Squared']]
+
+def scatter_plot(x_axis, y_axis_dict, depth_labels, var, variables, output_dir, conv_direction, stats, var_unit):
     fig, ax0 = plt.subplots()
     
     var_index = variables.index(var)
@@ -24,54 +62,37 @@ def scatter_plot(x_axis, y_axis_dict, depth_labels, var, variables, output_dir,
     ax0.tick_params(axis='y', labelsize=12)
     ax0.set_ylim(600, 2200)
 
-    # Extract unique values from x_axis and create a mapping to x positions
-    unique_x_values = np.unique(x_axis)
-    x_pos_mapping = {val: i for i, val in enumerate(unique_x_values)}
-
     # Base offset for the original data points
     base_offset = 0.04 * (max(x_axis) - min(x_axis))
 
     for i, depth_label in enumerate(depth_labels):
         # Apply base offset to x-values for the original data points
-        x_vals_original = [x + (i * base_offset) for x in x_axis]
+        x_vals_original = np.asarray(x_axis) + i * base_offset
         y_vals_original = y_axis_dict[depth_label]
 
         # Scatter plot for the original data points of each depth range
         ax0.scatter(x_vals_original, y_vals_original, label=f"Original Data {depth_label} km ({conv_direction} Convection)", marker='x', zorder=2, s=20)
 
-        rms_values = rms_values_dict[depth_label]
-        std_values = std_values_dict[depth_label]
+        # RMS, standard deviation and linear fit of this depth range, see stats_table
+        series = stats[(stats['Depth Label'] == depth_label) & (stats['Variable'] == var) & (stats['Convection Velocity'] == conv_direction)]
+        if series.empty:
+            continue
+
         # Further offset for RMS values
         rms_offset = (i + 0.5) * base_offset  # Adjust this as needed
 
         # Apply further offset to x-values for RMS and error bars
-        x_vals_rms = [x + rms_offset for x in list(rms_values.keys())]
-        y_vals_rms = [rms_values[x] for x in rms_values.keys()]
-
-        # Fit a linear model to the RMS values
-        slope, intercept, r_value, p_value, std_err = linregress(x_vals_rms, y_vals_rms)
-        line = slope * np.array(x_vals_rms) + intercept
+        x_vals_rms = series['X Value'].to_numpy() + rms_offset
+        y_vals_rms = series['RMS Value'].to_numpy()
 
         # Plot the line graph through the RMS values
+        line = series['Slope'].to_numpy() * series['X Value'].to_numpy() + series['Intercept'].to_numpy()
         ax0.plot(x_vals_rms, line, label=f'Linear Fit {depth_label} km', zorder=3, linewidth=2)
         
 
-        # Plot RMS values and error bars with further offset
-        for x_val, rms_val, std_val in zip(x_vals_rms, y_vals_rms, std_values.values()):
-            ax0.scatter(x_val, rms_val, color='black', edgecolors='face', linewidths=5, zorder=3+i)
-            ax0.errorbar(x_val, rms_val, yerr=std_val/2, elinewidth=2.5, color='black', capsize=5, markersize=10, zorder=4+i)
-
-        # Update RMS, standard deviation, gradient, and R-squared data for DataFrame
-        for original_x_val, rms_val in zip(list(rms_values.keys()), y_vals_rms):
-            rms_data.append({
-                'Depth Label': depth_label,
-                'Variable': var,
-                'Convection Velocity': conv_direction,
-                'X Value': original_x_val,  # Use the original x_val here
-                'RMS Value': rms_val,
-                'Standard Deviation': std_values[original_x_val],  # Use the original x_val here
-                
-            })
+        # Plot RMS values and error bars with further offset, one collection each for the whole series
+        ax0.scatter(x_vals_rms, y_vals_rms, color='black', edgecolors='face', linewidths=5, zorder=3+i)
+        ax0.errorbar(x_vals_rms, y_vals_rms, yerr=series['Standard Deviation'].to_numpy()/2, fmt='none', elinewidth=2.5, color='black', capsize=5, zorder=4+i)
     
     ax0.spines["top"].set_visible(False)
     ax0.spines["right"].set_visible(False)
@@ -84,12 +105,11 @@ def scatter_plot(x_axis, y_axis_dict, depth_labels, var, variables, output_dir,
     # plt.show()
     plt.close()
 
-def plot_rms_scatter(rms_csv_path, output_dir):
-    # Read RMS and Standard Deviation values from CSV
-    rms_df = pd.read_csv(rms_csv_path)
+def plot_rms_scatter(rms_df, output_dir):
+    # RMS and Standard Deviation values are read from the stats table, see stats_table
 
     # Get unique attributes
-    variables = rms_df['Variable'].unique()
+    variables = list(rms_df['Variable'].unique())
     convection_directions = rms_df['Convection Velocity'].unique()
 
     # Assign unique colors and markers to each depth range
@@ -98,6 +118,9 @@ def plot_rms_scatter(rms_csv_path, output_dir):
         '200-400': {'color': 'tab:orange', 'marker': 's'}
     }
 
+    # Position of each row on the x-axis, from the index of its variable
+    variable_position = rms_df['Variable'].map({variable: i for i, variable in enumerate(variables)}).astype(float)
+
     # Iterate over each convection direction to create a plot
     for conv_dir in convection_directions:
         fig, ax1 = plt.subplots(figsize=(10, 6))
@@ -109,17 +132,11 @@ def plot_rms_scatter(rms_csv_path, output_dir):
             # Apply a small offset for each depth range to distinguish them
             depth_offset = -0.05 if depth_label == '100-200' else 0.05
 
-            for i, variable in enumerate(variables):
-                # Filter the DataFrame for the current variable, convection direction, and depth label
-                subset_df = rms_df[(rms_df['Variable'] == variable) &
-                                   (rms_df['Convection Velocity'] == conv_dir) &
-                                   (rms_df['Depth Label'] == depth_label)]
-
-                if not subset_df.empty:
-                    # Plot each RMS value for the current variable and depth range
-                    for index, row in subset_df.iterrows():
-                        ax1.errorbar(i + depth_offset, row['RMS Value'], yerr=row['Standard Deviation']/2,
-                                    fmt=style['marker'], color=style['color'], capsize=3, label=f'{depth_label} km' if i == 0 and index == 0 else "")
+            # Every RMS value of the depth range in one errorbar call
+            subset = (rms_df['Convection Velocity'] == conv_dir) & (rms_df['Depth Label'] == depth_label)
+            if subset.any():
+                ax1.errorbar(variable_position[subset] + depth_offset, rms_df.loc[subset, 'RMS Value'], yerr=rms_df.loc[subset, 'Standard Deviation']/2,
+                             fmt=style['marker'], color=style['color'], capsize=3, label=f'{depth_label} km')
 
         # Set the x-ticks to correspond to the variables
         ax1.set_xticks(x_positions)
@@ -139,57 +156,42 @@ def plot_rms_scatter(rms_csv_path, output_dir):
         plt.close()
 
 def main():
-    # Load the csv file
-    df = pd.read_csv(r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\permutations.csv")
     output_dir = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\scatter plots\\"
 
-    # List to store RMS data for DataFrame
-    rms_data = []
-
     # Iterate between depth ranges
     y_axes = ['R values 100-200km', 'R values 200-400km']  # Temperature columns
     depth_labels = ["100-200", "200-400"]
 
+    # Build the table from the script_maker manifest and the timeseries store, see results_catalog
+    # set to False to read a hand made permutations.csv instead
+    use_catalog = True
+    if use_catalog:
+        manifest_file = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\manifest.csv"
+        store_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\timeseries"
+        catalog = results_catalog.build_catalog(manifest_file, store_path)
+        df = results_catalog.analysis_table(catalog, {'T 100-200km R': y_axes[0], 'T 200-400km R': y_axes[1]})
+        df = df.dropna(subset=y_axes, how='all')
+    else:
+        df = pd.read_csv(r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\permutations.csv")
+
     # For each variable, plot scatter plot, separating Convection Velocity
     variables = ['Lateral Extent', 'Convection Velocity', 'Mantle Interior Starting Temperature', 'Continental Crust Internal Heat Production', 'Continental Crust Thickness']
     variable_units = ['km', 'm/Yr', 'ºC', 'W/m$^3$', 'km']
 
-    for var in variables:
+    # RMS, standard deviation, count and linear fit of every variable, level, direction and depth range at once
+    stats = stats_table(df, variables, y_axes, depth_labels)
+    stats.to_csv(output_dir + 'rms_values.csv', index=False)
+
+    direction = convection_direction(df['Convection Velocity'])
+    for conv_direction in ['Positive', 'Negative']:
         # Separate data based on Convection Velocity
-        df_positive_conv = df[df['Convection Velocity'] > 0]
-        df_negative_conv = df[df['Convection Velocity'] < 0]
-
-        y_axis_pos_dict = {depth_label: df_positive_conv[y_axis].values for depth_label, y_axis in zip(depth_labels, y_axes)}
-        y_axis_neg_dict = {depth_label: df_negative_conv[y_axis].values for depth_label, y_axis in zip(depth_labels, y_axes)}
-
-        # Initialize dictionaries to store RMS and standard deviation values for each depth range
-        rms_values_pos_dict = {}
-        std_values_pos_dict = {}
-        rms_values_neg_dict = {}
-        std_values_neg_dict = {}
-
-        for i, y_axis in enumerate(y_axes):
-            # Calculate RMS and standard deviation for each x-axis value (positive convection)
-            rms_values_pos = df_positive_conv.groupby(var)[y_axis].apply(calculate_rms).to_dict()
-            std_values_pos = df_positive_conv.groupby(var)[y_axis].std().to_dict()
-            rms_values_pos_dict[depth_labels[i]] = rms_values_pos
-            std_values_pos_dict[depth_labels[i]] = std_values_pos
-
-            # Calculate RMS and standard deviation for each x-axis value (negative convection)
-            rms_values_neg = df_negative_conv.groupby(var)[y_axis].apply(calculate_rms).to_dict()
-            std_values_neg = df_negative_conv.groupby(var)[y_axis].std().to_dict()
-            rms_values_neg_dict[depth_labels[i]] = rms_values_neg
-            std_values_neg_dict[depth_labels[i]] = std_values_neg
-
-        # Call the scatter_plot function for positive and negative convection separately
-        scatter_plot(df_positive_conv[var], y_axis_pos_dict, depth_labels, var, variables, output_dir, "Positive", rms_values_pos_dict, std_values_pos_dict, rms_data, variable_units)
-        scatter_plot(df_negative_conv[var], y_axis_neg_dict, depth_labels, var, variables, output_dir, "Negative", rms_values_neg_dict, std_values_neg_dict, rms_data, variable_units)
-
-    # Create DataFrame and save to CSV
-    rms_df = pd.DataFrame(rms_data)
-    rms_df.to_csv(output_dir + 'rms_values.csv', index=False)
-
-    plot_rms_scatter(output_dir + 'rms_values.csv', output_dir)
+        df_conv = df[direction == conv_direction]
+        y_axis_dict = {depth_label: df_conv[y_axis].values for depth_label, y_axis in zip(depth_labels, y_axes)}
+
+        for var in variables:
+            scatter_plot(df_conv[var], y_axis_dict, depth_labels, var, variables, output_dir, conv_direction, stats, variable_units)
+
+    plot_rms_scatter(stats, output_dir)
 
 if __name__ == "__main__":
     main()
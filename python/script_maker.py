@@ -7,9 +7,14 @@
 
 import os
 import csv
+import string
+import hashlib
 import itertools
 import numpy as np
 import pandas as pd
+import sweep_design
+import initial_temperature
+from concurrent.futures import ProcessPoolExecutor
 
 # where created ASPECT scripts will be output
 output_dir = r'C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\automated\\'
@@ -18,36 +23,9 @@ output_dir = r'C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Ye
 # 1 Box size, 2 Convection Speed, 3 Start Temp, 4 Continent Internal Heating, 5 Continent Thickness
 input_file = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\input_file.csv"
 
-def process(parameters, index):
-    output_file = "v5_{:03d}__{}__{}__{}__{}__{}".format(index,*parameters)
-    output_file = output_file.replace('-','L')  # ASPECT doesn't like - and . in its directory naming 
-    output_file = output_file.replace('.', '_')
-
-    x_extent = parameters[0]    # x extent
-    oceanic_x_extent = 2*x_extent/3
-
-    convection_speed = parameters[1] # convection speed 
-
-    start_heat = parameters[2] # start internal heating 
-    h=3000000               # height of model
-    Ttop = 273              # temp at surface
-    Tmid = start_heat+273   # intermediate start temp
-    Tbot = 2723             # temp at core/mantle boundary
-    z0 = 0                  # distance to core/mantle boundary
-    z1 = h * 0.1            # distance to 10% above core/mantle boundary
-    z2 = h * 0.9            # distance to 10& below surface
-    z3 = h                  # distance to surface
-    heat_A = (Tbot - Tmid)/(z0-z1)   # top gradient
-    heat_B = (Tbot -Ttop)            
-    heat_C = (Tmid - Ttop)/(z2-z3)   # bottom gradient
-    heat_D = (Ttop-heat_C*z3 - Ttop) 
-
-    cont_int_heat = (parameters[3])*0.0000001 # internal heating of the continental crust (W/m^3)
-    cont_dens = 3350        # density of continental crust (kg/m^3)
-    cont_thickness = parameters[4]  # thickness of continental crust (m)
-
-    # default ASPECT script with wildcards where variables are changeable 
-    default = f"""
+# default ASPECT script with wildcards ($name) where variables are changeable 
+# Built once, each permutation only substitutes its values in
+PRM_TEMPLATE = string.Template("""
     # Input file for ASPECT
     # Jeroen van Hunen October 2023
     # Modified by Satoshi Purkiss January 2024
@@ -73,10 +51,18 @@ def process(parameters, index):
     set Nonlinear solver tolerance             = 1e-4
     set Max nonlinear iterations               = 1
     set CFL number                             = 0.5
-    set Output directory                       = {output_file}
+    set Output directory                       = $output_file
     set Timing output frequency                = 20
     set Pressure normalization                 = no
 
+    # Stop at the end time, or earlier when steady_monitor.py writes terminate-aspect in the output directory
+    subsection Termination criteria
+    set Termination criteria = end time, user request
+    subsection User request
+        set File name = terminate-aspect
+    end
+    end
+
     # Stokes solver parameters:
     subsection Solver parameters
     subsection Stokes solver parameters
@@ -91,7 +77,7 @@ def process(parameters, index):
     subsection Box
         set X repetitions = 5
         set Y repetitions = 1
-        set X extent      = {x_extent}
+        set X extent      = $x_extent
         set Y extent      = 3000000
         set X periodic    = false
     end
@@ -112,10 +98,10 @@ def process(parameters, index):
     subsection Initial composition model
     set Model name = function
     subsection Function
-        set Function constants = h = 3000000, w = {x_extent}
+        set Function constants = h = 3000000, w = $x_extent
 
         set Variable names      = 	x,y
-        set Function expression = if( x>(2*w/3) && y>(h-{cont_thickness}), 1, 0)
+        set Function expression = if( x>(2*w/3) && y>(h-$cont_thickness), 1, 0)
     end
     end
 
@@ -138,7 +124,7 @@ def process(parameters, index):
     
     subsection Function
         set Variable names      = x,z,t
-        set Function expression = if(x<{oceanic_x_extent}, {convection_speed},0); 0
+        set Function expression = if(x<$oceanic_x_extent, $convection_speed,0); 0
     end
     end
 
@@ -149,10 +135,10 @@ def process(parameters, index):
 
     subsection Function
         set Variable names      = x,z
-        set Function constants  = p=0.01, L=15000000, pi=3.1415926536, k=1, T0=273, h=3000000, A={heat_A}, B={heat_B}, C={heat_C}, D={heat_D}
+        set Function constants  = p=0.01, L=15000000, pi=3.1415926536, k=1, T0=273, h=3000000, A=$heat_A, B=$heat_B, C=$heat_C, D=$heat_D
         set Function expression = if(z<0.1*h, T0 + A*z+B - p*cos(k*pi*x/L)*sin(pi*z/h),\\
                                 if(z>0.9*h, T0 + C*z+D - p*cos(k*pi*x/L)*sin(pi*z/h),\\
-                                T0 + {start_heat} - p*cos(k*pi*x/L)*sin(pi*z/h)))
+                                T0 + $start_heat - p*cos(k*pi*x/L)*sin(pi*z/h)))
     end
     end
 
@@ -160,7 +146,7 @@ def process(parameters, index):
     subsection Heating model
     set List of model names = compositional heating
     subsection Compositional heating
-        set Compositional heating values = 6e-9, {cont_int_heat}
+        set Compositional heating values = 6e-9, $cont_int_heat
     end
     end
 
@@ -179,7 +165,7 @@ def process(parameters, index):
 
         set Thermal diffusivities = 1e-6
         set Heat capacities       = 1000.
-        set Densities             = 3400, {cont_dens}
+        set Densities             = 3400, $cont_dens
         set Thermal expansivities = 3e-5
 
         set Viscosity averaging scheme = harmonic
@@ -223,64 +209,136 @@ def process(parameters, index):
         set A2 = 1.174e-7
         end
     end
+    # 100 km zones at the same interval as the vtu output, for the full width bands of paraview_output_split_combine
+    subsection Depth average
+        set Number of zones = 30
+        set Output format = gnuplot
+        set Time between graphical output = 20000000
     end
-    """
+    end
+    """)
+
+def output_name(parameters, index):
+    # Name of the ASPECT output directory of a permutation
+    output_file = "v5_{:03d}__{}__{}__{}__{}__{}".format(index,*parameters)
+    output_file = output_file.replace('-','L')  # ASPECT doesn't like - and . in its directory naming 
+    output_file = output_file.replace('.', '_')
+    return output_file
 
-    # Writing the file to specifiec directory
-    file_path = output_dir+"v5_curtain_{:03d}_{}_{}_{}_{}_{}.prm".format(index,*parameters)
-    with open(file_path, 'w') as file:
-        file.write(default)
+def prm_values(parameters, index):
+    # Values of the wildcards in PRM_TEMPLATE for one permutation
+    x_extent = parameters[0]    # x extent
+    oceanic_x_extent = 2*x_extent/3
 
-    # print(f"String saved to {file_path}")
+    convection_speed = parameters[1] # convection speed 
 
-# To rename the files for indexing
-def rename_files_in_folder(folder_path):
-    # List all files in the folder
-    files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+    start_heat = parameters[2] # start internal heating 
+    # coefficients of the initial temperature profile, see initial_temperature
+    heat_A, heat_B, heat_C, heat_D = initial_temperature.coefficients(start_heat)
 
-    # Iterate over the files and rename them
-    for index, filename in enumerate(files, start=1):
-        # Create the new filename with a number prefix
-        new_filename = f"parameters{index:03d}.prm"
-        
-        # Full path for the old and new filenames
-        old_file = os.path.join(folder_path, filename)
-        new_file = os.path.join(folder_path, new_filename)
+    cont_int_heat = (parameters[3])*0.0000001 # internal heating of the continental crust (W/m^3)
+    cont_dens = 3350        # density of continental crust (kg/m^3)
+    cont_thickness = parameters[4]  # thickness of continental crust (m)
 
-        # Rename the file
-        os.rename(old_file, new_file)
-        # print(f"Renamed '{filename}' to '{new_filename}'")
+    return {
+        'output_file': output_name(parameters, index),
+        'x_extent': x_extent,
+        'oceanic_x_extent': oceanic_x_extent,
+        'convection_speed': convection_speed,
+        'start_heat': start_heat,
+        'heat_A': heat_A,
+        'heat_B': heat_B,
+        'heat_C': heat_C,
+        'heat_D': heat_D,
+        'cont_int_heat': cont_int_heat,
+        'cont_dens': cont_dens,
+        'cont_thickness': cont_thickness,
+    }
+
+def prm_file_name(index):
+    # Name the ASPECT script of a permutation is written under, as the slurm scripts expect
+    return f"parameters{index:03d}.prm"
+
+def process(parameters, index, output_dir=output_dir):
+    # Write the ASPECT script of one permutation straight to its final name
+    # Returns the file name and the sha256 of its contents
+    text = PRM_TEMPLATE.substitute(prm_values(parameters, index))
+    file_name = prm_file_name(index)
+
+    # Writing the file to specifiec directory, always with \n line endings so the hash is the same on every system
+    with open(os.path.join(output_dir, file_name), 'w', newline='\n') as file:
+        file.write(text)
+
+    # print(f"String saved to {file_path}")
+    return file_name, hashlib.sha256(text.encode()).hexdigest()
+
+def process_all(permutations, output_dir=output_dir, n_workers=1, start=1):
+    # Write the ASPECT script of every permutation, numbered from start in the order given
+    # With more than one worker the files are written over a pool of processes, None uses every core
+    indices = range(start, start + len(permutations))
+    if n_workers == 1:
+        return list(map(process, permutations, indices, itertools.repeat(output_dir)))
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(process, permutations, indices, itertools.repeat(output_dir), chunksize=16))
 
 # Write index and parameters used to csv
-def write_to_csv(filename, data):
-    with open(filename, mode='w', newline='') as file:
+# With append the rows are added to the end of an existing file, without a header
+def write_to_csv(filename, data, append=False):
+    with open(filename, mode='a' if append else 'w', newline='') as file:
         writer = csv.writer(file)
-        header = ['Index'] + [f'Variable_{i+1}' for i in range(len(data[0]) - 1)]
-        writer.writerow(header)
+        if not append:
+            header = ['Index'] + [f'Variable_{i+1}' for i in range(len(data[0]) - 1)]
+            writer.writerow(header)
 
         for row in data:
             writer.writerow(row)
 
+# Write index, file, output directory, parameters and file hash of every script to csv
+# start is the index of the first permutation, with append the rows are added to an existing manifest
+def write_manifest(filename, permutations, results, start=1, append=False):
+    with open(filename, mode='a' if append else 'w', newline='') as file:
+        writer = csv.writer(file)
+        if not append:
+            header = ['Index', 'File', 'Output Directory'] + [f'Variable_{i+1}' for i in range(len(permutations[0]))] + ['SHA256']
+            writer.writerow(header)
+
+        for index, (perm, (file_name, file_hash)) in enumerate(zip(permutations, results), start=start):
+            writer.writerow([index, file_name, output_name(perm, index)] + list(perm) + [file_hash])
+
 def main():
     df = np.array(pd.read_csv(input_file))
 
-    csv_data = []
-    index = 1
+    # number of processes writing the scripts, None uses every core
+    n_workers = 1
+
+    # sweep design, one of sweep_design.DESIGNS, 'full' is every combination of the levels in input_file
+    design = 'full'
+    design_options = {
+        'fractional': {'n_generated': 1},
+        'latin_hypercube': {'n_runs': 40, 'seed': 0},
+    }
+
+    # Show what each design would cost before writing anything
+    sweep_design.report_designs(df, design_options)
+
+    # for negative (left/anticlockwise) convection every run is followed by its mirror
+    permutations = sweep_design.mirror_convection(sweep_design.make_design(design, df, **design_options.get(design, {})))
+    permutations = [list(perm) for perm in permutations]
+    print(f"Writing {len(permutations)} runs of the {design} design")
 
-    for perm in list(itertools.product(*df)):
-        process(perm, index)
-        csv_data.append([index] + list(perm))
-        index += 1 # Increment index
+    # Each script is written straight to parametersNNN.prm, NNN being its index in permutations.csv
+    results = process_all(permutations, output_dir, n_workers)
 
-    # for negative (left/anticlockwise) convection:
-        neg_perm = list(perm)
-        neg_perm[1] = -neg_perm[1]
-        process(neg_perm, index)
-        csv_data.append([index] + list(neg_perm))
-        index += 1 # Increment index
+    # Check the initial temperature of every script before anything is submitted
+    checks = initial_temperature.validate_prm_files([os.path.join(output_dir, file_name) for file_name, file_hash in results])
+    if not checks['OK'].all():
+        print(checks[~checks['OK']].to_string(index=False))
+        raise ValueError(f"{(~checks['OK']).sum()} scripts have a bad initial temperature")
 
-    write_to_csv(output_dir+r"..\\"+'permutations.csv', csv_data)
-    rename_files_in_folder(output_dir)
+    csv_data = [[index] + perm for index, perm in enumerate(permutations, start=1)]
+    write_to_csv(os.path.join(output_dir, '..', 'permutations.csv'), csv_data)
+    write_manifest(os.path.join(output_dir, '..', 'manifest.csv'), permutations, results)
 
 
 if __name__ == "__main__":
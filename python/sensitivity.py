@@ -0,0 +1,168 @@
+# Sensitivity of the steady state temperature to each parameter of the sweep
+
+# Main effect (first order Sobol) index of each variable from an ANOVA split of the variance over the permutation table,
+#   S = variance of the mean temperature at each level of the variable / variance of every run
+# what is left after the main effects (1 - sum of S) is down to interactions between the variables and noise
+# Bootstrap confidence intervals of the indices and of the RMS temperature at each level come from a residual bootstrap
+# of the fitted main effects model: every resample keeps the runs (and so the balance of the factorial design) and adds
+# resampled residuals to the fitted temperatures. Resampling whole runs would unbalance the levels and give a variable
+# with no effect an interval well above its own index
+# The noise in the residuals still pushes every resampled index up a little, so the intervals are shifted by the
+# bootstrap bias (mean of the resamples less the estimate) to centre them on the estimate
+# Every resample of a chunk is done at once with bincount over (resample, level) pairs, and the chunks can be spread
+# over a pool of processes, so thousands of resamples take seconds
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import results_catalog
+
+def level_codes(df, variables):
+    # Level number of each run for each variable (runs x variables) and the levels of each variable
+    codes = np.empty((len(df), len(variables)), dtype=np.int64)
+    levels = []
+    for j, variable in enumerate(variables):
+        codes[:, j], uniques = pd.factorize(df[variable], sort=True)
+        levels.append(np.asarray(uniques))
+    return codes, levels
+
+def grouped_sums(codes, n_levels, values):
+    # Count, sum and sum of squares of values at each level, for many resamples at once
+    # codes and values are (resamples x runs), the results are (resamples x n_levels)
+    n_resamples = codes.shape[0]
+    flat = (np.arange(n_resamples)[:, None] * n_levels + codes).ravel()
+    size = n_resamples * n_levels
+    count = np.bincount(flat, minlength=size).reshape(n_resamples, n_levels)
+    total = np.bincount(flat, weights=values.ravel(), minlength=size).reshape(n_resamples, n_levels)
+    squares = np.bincount(flat, weights=(values**2).ravel(), minlength=size).reshape(n_resamples, n_levels)
+    return count, total, squares
+
+def main_effects(codes, n_levels, y):
+    # Main effect index of every variable for each resample, y is (resamples x runs) and codes (resamples x runs x variables)
+    # Returns (resamples x variables)
+    total_variance = y.var(axis=1)
+    overall = y.mean(axis=1, keepdims=True)
+    indices = np.empty((y.shape[0], codes.shape[2]))
+    for j in range(codes.shape[2]):
+        count, total, _ = grouped_sums(codes[:, :, j], n_levels[j], y)
+        level_mean = total / np.maximum(count, 1)
+        between = np.sum(count * (level_mean - overall)**2, axis=1) / y.shape[1]
+        indices[:, j] = between / np.where(total_variance > 0, total_variance, np.nan)
+    return indices
+
+def level_rms(codes, n_levels, y):
+    # RMS of y at each level of every variable for each resample, a list of (resamples x levels) arrays
+    rms = []
+    for j in range(codes.shape[2]):
+        count, _, squares = grouped_sums(codes[:, :, j], n_levels[j], y)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rms.append(np.sqrt(squares / count))
+    return rms
+
+def main_effects_fit(codes, n_levels, y):
+    # Least squares fit of the additive main effects model (a mean for every level of every variable)
+    # Returns the fitted values and the residuals, scaled up for the parameters fitted so their spread matches the noise
+    columns = [np.ones(len(y))]
+    for j, n in enumerate(n_levels):
+        columns += [(codes[:, j] == level).astype(float) for level in range(1, n)]
+    X = np.column_stack(columns)
+    coefficients, _, rank, _ = np.linalg.lstsq(X, y, rcond=None)
+    fitted = X @ coefficients
+    residuals = (y - fitted) * np.sqrt(len(y) / max(len(y) - rank, 1))
+    return fitted, residuals
+
+def bootstrap_chunk(codes, n_levels, fitted, residuals, n_resamples, seed):
+    # Main effect indices and level RMS of n_resamples residual resamples, the fitted values plus residuals drawn with replacement
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(residuals), size=(n_resamples, len(residuals)))
+    y = fitted[None, :] + residuals[picks]
+    design = np.broadcast_to(codes, (n_resamples,) + codes.shape)
+    return main_effects(design, n_levels, y), level_rms(design, n_levels, y)
+
+def bootstrap(codes, n_levels, y, n_boot=2000, chunk=250, seed=None, n_workers=1):
+    # Main effect indices (n_boot x variables) and level RMS (list of n_boot x levels) of n_boot residual resamples
+    # The resamples are drawn in chunks of chunk to keep memory down, spread over n_workers processes (None uses every core)
+    fitted, residuals = main_effects_fit(codes, n_levels, y)
+    sizes = [min(chunk, n_boot - start) for start in range(0, n_boot, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = ([codes] * len(sizes), [n_levels] * len(sizes), [fitted] * len(sizes), [residuals] * len(sizes), sizes, seeds)
+
+    if n_workers == 1:
+        results = list(map(bootstrap_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(bootstrap_chunk, *args))
+
+    indices = np.vstack([result[0] for result in results])
+    rms = [np.vstack([result[1][j] for result in results]) for j in range(len(n_levels))]
+    return indices, rms
+
+def corrected_interval(estimate, resamples, low, high):
+    # Percentile interval of the resamples shifted by the bootstrap bias, so it is centred on the estimate
+    bias = np.nanmean(resamples, axis=0) - estimate
+    return np.nanpercentile(resamples, low, axis=0) - bias, np.nanpercentile(resamples, high, axis=0) - bias
+
+def sensitivity(df, variables, column, n_boot=2000, ci=0.95, seed=None, n_workers=1):
+    # Main effect index of each variable on column, and the RMS of column at each level of each variable,
+    # both with bootstrap confidence intervals
+    # Returns two tables (indices, level RMS)
+    df = df.dropna(subset=[column])
+    y = df[column].to_numpy(dtype=float)
+    codes, levels = level_codes(df, variables)
+    n_levels = [len(level) for level in levels]
+
+    boot_indices, boot_rms = bootstrap(codes, n_levels, y, n_boot, seed=seed, n_workers=n_workers)
+    low, high = 100 * (1 - ci) / 2, 100 * (1 + ci) / 2
+
+    indices = main_effects(codes[None], n_levels, y[None])[0]
+    index_low, index_high = corrected_interval(indices, boot_indices, low, high)
+    index_table = pd.DataFrame({
+        'Variable': variables,
+        'Main Effect Index': indices,
+        'CI Low': np.maximum(index_low, 0),
+        'CI High': index_high,
+    })
+    index_table['Interactions'] = 1 - indices.sum()
+
+    rows = []
+    rms = level_rms(codes[None], n_levels, y[None])
+    for j, variable in enumerate(variables):
+        counts = np.bincount(codes[:, j], minlength=n_levels[j])
+        rms_low, rms_high = corrected_interval(rms[j][0], boot_rms[j], low, high)
+        rows.append(pd.DataFrame({
+            'Variable': variable,
+            'Level': levels[j],
+            'Count': counts,
+            'RMS Value': rms[j][0],
+            'CI Low': rms_low,
+            'CI High': rms_high,
+        }))
+    return index_table, pd.concat(rows, ignore_index=True)
+
+def main():
+    manifest_file = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\manifest.csv"
+    store_path = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\vtu_handler_outputs\third_split\v5\timeseries"
+    output_dir = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\scatter plots\\"
+
+    variables = ['Lateral Extent', 'Convection Velocity', 'Mantle Interior Starting Temperature', 'Continental Crust Internal Heat Production', 'Continental Crust Thickness']
+    y_axes = ['R values 100-200km', 'R values 200-400km']  # Temperature columns
+    depth_labels = ["100-200", "200-400"]
+
+    # The table of every run with its parameters and steady state temperatures, see results_catalog
+    catalog = results_catalog.build_catalog(manifest_file, store_path)
+    df = results_catalog.analysis_table(catalog, {'T 100-200km R': y_axes[0], 'T 200-400km R': y_axes[1]})
+
+    # number of bootstrap resamples and processes to spread them over (None uses every core)
+    n_boot = 5000
+    n_workers = None
+
+    for y_axis, depth_label in zip(y_axes, depth_labels):
+        index_table, rms_table = sensitivity(df, variables, y_axis, n_boot, seed=0, n_workers=n_workers)
+        print(f"{depth_label} km")
+        print(index_table.to_string(index=False))
+
+        index_table.to_csv(output_dir + f'sensitivity_{depth_label}.csv', index=False)
+        rms_table.to_csv(output_dir + f'level_rms_ci_{depth_label}.csv', index=False)
+
+if __name__ == "__main__":
+    main()
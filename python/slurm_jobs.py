@@ -0,0 +1,187 @@
+# Script to turn the script_maker manifest into slurm array jobs
+
+# Each run is given an expected cost from its mesh size and lateral extent, calibrated so the largest box
+# just fills one allocation (RANKS cores for HOURS hours)
+# Cheaper runs are packed several to an allocation, each on an equal share of the cores, and the tasks are
+# grouped by how many runs they hold so each group gets its own array script with a time limit to suit
+# Runs that already have an output directory are left out, so the same command can be rerun as runs are submitted
+# without queueing a second copy of a run that is still going (restart resubmits the ones that stopped unfinished)
+# The analysis scripts are staged with the task files so steady_monitor.py can run on the cluster
+
+import os
+import csv
+import math
+import shutil
+import numpy as np
+import pandas as pd
+from sweep_design import RANKS, HOURS
+
+REFERENCE_EXTENT = 30000000     # lateral extent (m) of the runs that need a whole allocation
+
+ARRAY_SCRIPT = """#!/bin/bash -i
+
+# Request resources:
+#SBATCH -n {ranks}          # number of MPI ranks (1 per CPU core)
+#SBATCH --mem-per-cpu=2G
+#SBATCH --gres=tmp:2G  # temporary disk space required on each allocated compute node ($TMPDIR)
+#SBATCH -N 1           # number of compute nodes.
+#SBATCH -t {hours}:00:0       # time limit for job (format: days-hours:minutes:seconds)
+#SBATCH -p shared
+#SBATCH --array=1-{n_tasks}     # one task per line of {task_file}
+
+# Commands to execute start here
+module load gcc/native openmpi openblas python
+
+filepath="{prm_folder}"
+
+# the analysis scripts are staged next to the task files by make_jobs, steady_monitor.py needs them all
+export PYTHONPATH="$filepath/python"
+export MPLBACKEND=Agg
+python -c "import steady_monitor" || {{ echo "steady_monitor can not be imported from $PYTHONPATH"; exit 1; }}
+
+# Each line of the task file lists the .prm files run together in one allocation
+# the cores are shared equally between them
+TASK=$(sed -n "${{SLURM_ARRAY_TASK_ID}}p" "$filepath/{task_file}")
+set -- $TASK
+RANKS=$((SLURM_NTASKS / $#))
+
+# srun --exact gives each run its own cores of the allocation, several mpirun would all bind to the first ones
+# steady_monitor.py stops each run once it reaches steady state, the monitors are left out of the wait
+# so a run that ends without reaching it does not hold the allocation
+PIDS=""
+for FILE in "$@"; do
+    srun --exact -n $RANKS --cpu-bind=cores ./aspect "$filepath/$FILE" &
+    PIDS="$PIDS $!"
+    OUTPUT=$(sed -n 's/^ *set Output directory *= *//p' "$filepath/$FILE")
+    python "$PYTHONPATH/steady_monitor.py" "$OUTPUT" &
+done
+wait $PIDS
+"""
+
+def estimate_core_hours(x_extent, refinement=6, x_repetitions=5, y_repetitions=1, reference_extent=REFERENCE_EXTENT):
+    # Expected core hours of a run, in proportion to the number of cells and the lateral extent
+    # The defaults are the mesh of the script_maker template, whose largest box fills RANKS x HOURS
+    cells = x_repetitions * y_repetitions * 4**refinement
+    reference_cells = 5 * 1 * 4**6
+    return RANKS * HOURS * (cells / reference_cells) * (np.asarray(x_extent, dtype=float) / reference_extent)
+
+def run_started(output_folder):
+    # True if the run has an output directory, it has been submitted before and may still be running
+    return os.path.isdir(output_folder)
+
+def run_finished(output_folder):
+    # True if ASPECT got to the end of the run in output_folder
+    log_file = os.path.join(output_folder, 'log.txt')
+    if not os.path.isfile(log_file):
+        return False
+    with open(log_file, errors='ignore') as file:
+        return any('Termination requested by criterion' in line for line in file)
+
+def pack_runs(costs, ranks=RANKS, hours=HOURS, max_pack=8, safety=1.25):
+    # Group the runs (by position in costs) into allocations of ranks cores for hours
+    # Runs are taken from most to least expensive, and each allocation holds as many runs as fit
+    # when every run gets an equal share of the cores, up to max_pack
+    # The runs only fill 1/safety of an allocation, so the time limit leaves room for runs that take longer than estimated
+    # Returns a list of (n_pack, runs), the last allocation of each n_pack may hold fewer runs
+    order = np.argsort(-np.asarray(costs), kind='stable')
+    capacity = ranks * hours / safety
+
+    tasks = []
+    i = 0
+    while i < len(order):
+        largest = costs[order[i]]
+        n_pack = int(min(max_pack, ranks, max(1, capacity // largest))) if largest > 0 else max_pack
+        tasks.append((n_pack, list(order[i:i + n_pack])))
+        i += n_pack
+    return tasks
+
+def stage_code(job_folder):
+    # Copy the analysis scripts to job_folder/python, where the array scripts run steady_monitor.py from
+    code_folder = os.path.join(job_folder, 'python')
+    os.makedirs(code_folder, exist_ok=True)
+    source_folder = os.path.dirname(os.path.abspath(__file__))
+    for filename in os.listdir(source_folder):
+        if filename.endswith('.py'):
+            shutil.copy2(os.path.join(source_folder, filename), code_folder)
+    return code_folder
+
+def make_jobs(manifest_file, job_folder, run_folder=None, prm_folder='.', ranks=RANKS, hours=HOURS, max_pack=8, safety=1.25, restart=False, indices=None):
+    # Write the job manifest, task files and array scripts for every run in the manifest still to do
+    # run_folder is where the ASPECT output directories end up, runs with an output directory there are skipped
+    # as they may still be running and a second copy would write into the same directory
+    # With restart only the runs that finished are skipped, to resubmit runs that stopped part way (e.g. at the time limit)
+    # prm_folder is where the .prm files and task files are on the cluster, job_folder is copied there
+    # indices limits the jobs to the runs with those manifest indices, e.g. the batch adaptive_sweep has just added
+    manifest = pd.read_csv(manifest_file)
+    if indices is not None:
+        manifest = manifest[manifest['Index'].isin(list(indices))].reset_index(drop=True)
+    if run_folder is not None:
+        check = run_finished if restart else run_started
+        skip = manifest['Output Directory'].map(lambda name: check(os.path.join(run_folder, name)))
+        print(f"Skipping {skip.sum()} runs that have " + ("already finished" if restart else "an output directory, use restart to resubmit unfinished ones"))
+        manifest = manifest[~skip].reset_index(drop=True)
+    if manifest.empty:
+        print("Nothing left to run")
+        return []
+
+    # Variable_1 is the lateral extent of the box
+    costs = estimate_core_hours(manifest['Variable_1'])
+    tasks = pack_runs(costs, ranks, hours, max_pack, safety)
+
+    # Tasks packed the same way go in the same array
+    groups = {}
+    for n_pack, task in tasks:
+        groups.setdefault(n_pack, []).append(task)
+
+    os.makedirs(job_folder, exist_ok=True)
+    stage_code(job_folder)
+    job_rows = []
+    scripts = []
+    for n_pack, group_tasks in sorted(groups.items()):
+        task_file = f'tasks_pack{n_pack}.txt'
+        with open(os.path.join(job_folder, task_file), 'w', newline='\n') as file:
+            for task in group_tasks:
+                file.write(' '.join(manifest.loc[task, 'File']) + '\n')
+
+        # Each run gets an equal share of the cores, so takes len(task) times as long as it would on all of them
+        wall_hours = max(costs[task].max() * len(task) for task in group_tasks) / ranks
+        time_limit = min(hours, max(1, math.ceil(wall_hours * safety)))
+        if wall_hours * safety > hours:
+            print(f"Warning: tasks_pack{n_pack} is expected to take {wall_hours:.0f} hours, the {hours} hour limit "
+                  f"leaves less than the {safety:g} safety margin and a slow run will time out")
+
+        script = os.path.join(job_folder, f'mpi_array_pack{n_pack}.slurm')
+        with open(script, 'w', newline='\n') as file:
+            file.write(ARRAY_SCRIPT.format(ranks=ranks, hours=time_limit, n_tasks=len(group_tasks), task_file=task_file, prm_folder=prm_folder))
+        scripts.append(script)
+
+        for task_id, task in enumerate(group_tasks, start=1):
+            for run in task:
+                job_rows.append([os.path.basename(script), task_id, manifest.loc[run, 'Index'], manifest.loc[run, 'File'],
+                                 manifest.loc[run, 'Output Directory'], round(float(costs[run]), 1), ranks // len(task)])
+
+        print(f"{os.path.basename(script)}: {len(group_tasks)} tasks of up to {n_pack} runs, {time_limit} hour limit")
+
+    with open(os.path.join(job_folder, 'job_manifest.csv'), mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Script', 'Task', 'Index', 'File', 'Output Directory', 'Estimated Core Hours', 'Ranks'])
+        writer.writerows(job_rows)
+
+    used = len(tasks) * ranks * hours
+    print(f"{len(manifest)} runs in {len(tasks)} allocations, {used:,} core hours allocated at most")
+    return scripts
+
+def main():
+    manifest_file = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\manifest.csv"
+    job_folder = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\Code\automated"
+    # ASPECT output directories, runs that finished here are not submitted again (None to submit everything)
+    run_folder = None
+    # resubmit runs that have an output directory but did not finish, only once they are no longer in squeue
+    restart = False
+    # where the .prm files and task files are on the cluster, job_folder is copied here
+    prm_folder = "/nobackup/tkqk62/diss/code/v5_num_only"
+
+    make_jobs(manifest_file, job_folder, run_folder, prm_folder, restart=restart)
+
+if __name__ == "__main__":
+    main()
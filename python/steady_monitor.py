@@ -0,0 +1,146 @@
+# Monitor that stops an ASPECT run once its temperatures have reached steady state
+
+# ASPECT looks for a file called terminate-aspect in its output directory (Termination criteria = user request,
+# set in the script_maker template) and finishes the run cleanly when it appears
+# The monitor reduces each new vtu file of a running model to the same L and R temperature of each depth band
+# that paraview_output_split_combine judges steady state on, and applies the same criterion to them
+# Once every series has passed the criterion and its gradient has stayed below the threshold over the last hold
+# outputs the file is written, so a single calm spot in a series that is still drifting does not stop the run
+# The criterion only looks at windows ending before the last output, so the onset found while the run is going
+# is the one found afterwards from the full series
+
+# replay() runs the monitor over the recorded files of a finished run, so it can be checked without the cluster
+# Run as: python steady_monitor.py <ASPECT output directory> [replay]
+
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
+import steady_state
+import aspect_output
+import region_index
+import vtu_reader
+import paraview_output_split_combine as pipeline
+
+STOP_FILE = 'terminate-aspect'
+OUTPUT_INTERVAL = 20000000      # years between graphical outputs in the template, used if the files have no times
+
+class SteadyStateMonitor:
+    # Steady state check of one running model, see the top of the file
+
+    def __init__(self, output_folder, bands=((100, 200), (200, 400)), window=steady_state.WINDOW,
+                 threshold=steady_state.THRESHOLD, min_start=steady_state.MIN_START, hold=10):
+        self.output_folder = output_folder
+        self.window = window
+        self.threshold = threshold
+        self.min_start = min_start
+        self.hold = hold        # outputs every series has to stay calm for before the run is stopped
+        self.spec = {'bands': [tuple(band) for band in bands], 'fields': ['T'], 'regions': ['L', 'R'], 'weights': None}
+        self.labels = pipeline.reduction_columns(self.spec)
+        self.index = []
+        self.reduced = {}       # values of each vtu file reduced so far
+        self.regions = None
+
+    def outputs(self):
+        # (time, vtu file) of every output written so far, the solution.pvd only lists files ASPECT has finished writing
+        if not os.path.isdir(os.path.join(self.output_folder, 'solution')):
+            return []
+        return aspect_output.timestep_index(self.output_folder, OUTPUT_INTERVAL)
+
+    def update(self):
+        # Reduce the vtu files written since the last update, returns how many there were
+        self.index = self.outputs()
+        new = [file_path for output_time, file_path in self.index if file_path not in self.reduced]
+        for file_path in new:
+            vtufile = vtu_reader.VTUFile(file_path, dim=2)
+            if self.regions is None:
+                # The mesh is the same at every output, so the region index is only made once
+                bands = [(top_depth*1000, bottom_depth*1000) for top_depth, bottom_depth in self.spec['bands']]
+                self.regions = region_index.get_region_index(vtufile.points, bands)
+            self.reduced[file_path] = pipeline.reduce_vtu_data(vtufile, self.spec, self.regions)
+        return len(new)
+
+    def series(self):
+        # Output times and the L and R temperature of each band (len(labels) x outputs) reduced so far
+        times, file_paths = aspect_output.times_and_files(self.index)
+        values = np.array([self.reduced[file_path] for file_path in file_paths], dtype=float).reshape(len(file_paths), len(self.labels))
+        return times, values.T
+
+    def check(self, times, values):
+        # Onset of each series and whether every one is steady: the criterion of paraview_output_split_combine has been met
+        # at least hold outputs ago and the gradient has stayed below the threshold over all of the last hold outputs
+        onset, reached = steady_state.find_steady_state(values, self.window, self.threshold, self.min_start)
+        n_outputs = values.shape[1]
+        if n_outputs < max(2, self.hold):
+            return onset, False
+        calm = np.abs(np.gradient(values, axis=1)[:, -self.hold:]) < self.threshold
+        held = reached & (n_outputs - onset >= self.hold) & calm.all(axis=1)
+        return onset, bool(held.all())
+
+    def run_finished(self):
+        log_file = os.path.join(self.output_folder, 'log.txt')
+        if not os.path.isfile(log_file):
+            return False
+        with open(log_file, errors='ignore') as file:
+            return any('Termination requested by criterion' in line for line in file)
+
+    def stop(self, times, onset):
+        # Write the file ASPECT checks for, with the steady state onset of each series for the record
+        with open(os.path.join(self.output_folder, STOP_FILE), 'w') as file:
+            file.write(f"Steady state held at {times[-1] / 1e6:.0f} Myr\n")
+            for label, start in zip(self.labels, onset):
+                file.write(f"{label} onset {times[start] / 1e6:.0f} Myr\n")
+
+def monitor(output_folder, poll_seconds=300, **options):
+    # Check the run every poll_seconds until it reaches steady state or ASPECT finishes on its own
+    # Returns the model time (years) the stop file was written at, or None
+    run = SteadyStateMonitor(output_folder, **options)
+    while not run.run_finished():
+        # ASPECT rewrites solution.pvd in place at every output, a poll can catch it (or a vtu file) half written
+        try:
+            run.update()
+        except (ET.ParseError, ValueError, OSError) as error:
+            print(f"{output_folder}: could not read the output ({error}), trying again at the next check")
+            time.sleep(poll_seconds)
+            continue
+        times, values = run.series()
+        onset, steady = run.check(times, values)
+        if steady:
+            run.stop(times, onset)
+            print(f"{output_folder}: steady state reached, stop requested at {times[-1] / 1e6:.0f} Myr")
+            return times[-1]
+        time.sleep(poll_seconds)
+    return None
+
+def replay(output_folder, **options):
+    # Run the monitor over the recorded output of a run one output at a time
+    # Returns the model time (years) the run would have been stopped at, or None, and the last time it reached
+    run = SteadyStateMonitor(output_folder, **options)
+    run.update()
+    times, values = run.series()
+    for n in range(1, len(times) + 1):
+        onset, steady = run.check(times[:n], values[:, :n])
+        if steady:
+            print(f"{output_folder}: would stop at {times[n - 1] / 1e6:.0f} of {times[-1] / 1e6:.0f} Myr "
+                  f"({1 - times[n - 1] / times[-1]:.0%} of the run saved)")
+            return times[n - 1], times[-1]
+    print(f"{output_folder}: never steady, runs to {times[-1] / 1e6:.0f} Myr" if len(times) else f"{output_folder}: no output")
+    return None, (times[-1] if len(times) else None)
+
+def main():
+    # ASPECT output directory of the run to watch, e.g. v5_001__7500000__0_01__1400__1__100000
+    output_folder = r"C:\Users\satos\OneDrive - Durham University\Documents\UniStuff\Year 3\Diss\model outputs\v5\v5_001__7500000__0_01__1400__1__100000"
+    # seconds between checks of a running model
+    poll_seconds = 300
+
+    if len(sys.argv) > 1:
+        output_folder = sys.argv[1]
+
+    if len(sys.argv) > 2 and sys.argv[2] == 'replay':
+        replay(output_folder)
+    else:
+        monitor(output_folder, poll_seconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Steady state detection for temperature time series
+
+# A series is steady once the magnitude of its gradient has stayed below threshold for window timesteps in a row
+# Every series is checked at once, so a whole sweep of runs can be passed in as one (runs x timesteps) array
+
+import numpy as np
+
+WINDOW = 3          # number of timesteps the gradient has to stay small for
+THRESHOLD = 15      # largest gradient magnitude that counts as steady (K per timestep)
+MIN_START = 25      # timesteps before this are never treated as steady
+
+def find_steady_state(series, window=WINDOW, threshold=THRESHOLD, min_start=MIN_START):
+    # Find the first timestep of the steady state of each series
+    # series is (timesteps) or (runs x timesteps), shorter runs can be padded with nan at the end
+    # The window has to end before min_start and before the last timestep, as in the original find_index loop
+    # Returns the onset index of each series and whether it ever reached steady state,
+    # series that never do are given an onset of min_start
+    series = np.atleast_2d(np.asarray(series, dtype=float))
+    n_series, n_timesteps = series.shape
+
+    onset = np.full(n_series, min_start)
+    reached = np.zeros(n_series, dtype=bool)
+    if n_timesteps < 2:
+        return onset, reached
+
+    # Count the calm timesteps in every window with a running sum, nan counts as not calm
+    calm = np.abs(np.gradient(series, axis=1)) < threshold
+    calm_count = np.cumsum(np.pad(calm, ((0, 0), (1, 0))), axis=1)
+    steady = (calm_count[:, window:] - calm_count[:, :-window]) == window   # steady[:, j] covers j to j + window - 1
+
+    first = max(min_start - window, 0)
+    last = n_timesteps - window     # window must end before the last timestep
+    steady = steady[:, first:last]
+    if steady.shape[1] == 0:
+        return onset, reached
+
+    reached = steady.any(axis=1)
+    onset[reached] = first + steady[reached].argmax(axis=1)
+    return onset, reached
+
+def steady_state_mean(series, onset):
+    # Mean of each series from its onset to the end, ignoring nan padding
+    series = np.atleast_2d(np.asarray(series, dtype=float))
+    after_onset = np.arange(series.shape[1]) >= np.asarray(onset)[:, None]
+    return np.nanmean(np.where(after_onset, series, np.nan), axis=1)
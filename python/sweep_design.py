@@ -0,0 +1,104 @@
+# Designs for the parameter sweep built from the input csv of script_maker
+
+# levels is the input csv as an array, one row per variable and one column per level (low, medium, high)
+# Every design returns an array of parameter values, one row per run, ready to pass to script_maker.process_all
+#   full             every combination of levels (the original sweep)
+#   fractional       a regular fraction of the full factorial, some variables are generated from the others
+#   latin_hypercube  n_runs spread evenly over the range of every variable
+#   one_at_a_time    a baseline run plus each variable moved to each of its other levels
+
+import itertools
+import numpy as np
+
+RANKS = 32          # MPI ranks asked for by each run (slurm/mpi_batch.slurm)
+HOURS = 72          # time limit of each run (hours)
+
+def full_factorial(levels):
+    # Every combination of levels, the last variable changing fastest as itertools.product does
+    levels = np.asarray(levels)
+    return np.array(list(itertools.product(*levels)))
+
+def fraction_generators(n_levels, n_base, n_generated):
+    # Coefficients of the base variables that make each generated variable, (level index sum) mod n_levels
+    # Words with the most base variables are used first to keep main effects apart from interactions
+    words = [word for word in itertools.product(range(n_levels), repeat=n_base)
+             if np.count_nonzero(word) >= 2 and word[np.flatnonzero(word)[0]] == 1]
+    words.sort(key=lambda word: -np.count_nonzero(word))
+    if len(words) < n_generated:
+        raise ValueError(f"can't generate {n_generated} variables from {n_base} base variables")
+    return np.array(words[:n_generated])
+
+def fractional_factorial(levels, n_generated=1):
+    # 1/(n_levels^n_generated) fraction of the full factorial
+    # The first variables form a full factorial and the last n_generated are set from their level indices
+    # Needs the same prime number of levels (e.g. 3) for every variable
+    levels = np.asarray(levels)
+    n_variables, n_levels = levels.shape
+    n_base = n_variables - n_generated
+
+    base = np.array(list(itertools.product(range(n_levels), repeat=n_base)))
+    generated = (base @ fraction_generators(n_levels, n_base, n_generated).T) % n_levels
+    level_index = np.hstack([base, generated])
+    return levels[np.arange(n_variables), level_index]
+
+def latin_hypercube(levels, n_runs, seed=None):
+    # n_runs with each variable's range, lowest to highest level, split into n_runs strata that are each sampled once
+    levels = np.asarray(levels, dtype=float)
+    rng = np.random.default_rng(seed)
+    n_variables = levels.shape[0]
+
+    strata = np.argsort(rng.random((n_runs, n_variables)), axis=0)
+    unit = (strata + rng.random((n_runs, n_variables))) / n_runs
+    low = levels.min(axis=1)
+    high = levels.max(axis=1)
+    return low + unit * (high - low)
+
+def one_at_a_time(levels, baseline=1):
+    # The baseline run (every variable at level index baseline) then each variable moved to each other level
+    levels = np.asarray(levels)
+    n_variables, n_levels = levels.shape
+    base_run = levels[:, baseline]
+
+    runs = [base_run]
+    for variable in range(n_variables):
+        for level in range(n_levels):
+            if level != baseline:
+                run = base_run.copy()
+                run[variable] = levels[variable, level]
+                runs.append(run)
+    return np.array(runs)
+
+DESIGNS = {
+    'full': full_factorial,
+    'fractional': fractional_factorial,
+    'latin_hypercube': latin_hypercube,
+    'one_at_a_time': one_at_a_time,
+}
+
+def make_design(name, levels, **options):
+    # Build one of the DESIGNS, options are passed on to it (e.g. n_runs for latin_hypercube)
+    return DESIGNS[name](levels, **options)
+
+def mirror_convection(design, column=1):
+    # Follow every run with the same run with negative (left/anticlockwise) convection
+    mirrored = design.copy()
+    mirrored[:, column] = -mirrored[:, column]
+    return np.stack([design, mirrored], axis=1).reshape(-1, design.shape[1])
+
+def design_cost(n_runs, ranks=RANKS, hours=HOURS):
+    # Core hours allocated to n_runs, each asking for ranks cores for hours
+    return n_runs * ranks * hours
+
+def report_designs(levels, options=None, mirror=True, ranks=RANKS, hours=HOURS):
+    # Print the number of runs and core hours of every design before any files are written
+    # options holds the options of each design by name, e.g. {'latin_hypercube': {'n_runs': 40}}
+    options = options or {}
+    print(f"{'Design':<18}{'Runs':>8}{'Core hours':>14}")
+    for name in DESIGNS:
+        try:
+            design = make_design(name, levels, **options.get(name, {}))
+        except (TypeError, ValueError) as error:
+            print(f"{name:<18}{'n/a':>8}  ({error})")
+            continue
+        n_runs = len(design) * (2 if mirror else 1)
+        print(f"{name:<18}{n_runs:>8}{design_cost(n_runs, ranks, hours):>14,}")
@@ -0,0 +1,73 @@
+# Columnar store of the reduced time series of every model run
+
+# The store is a folder of .npy files that can be memory mapped, so the curves of every run
+# load in milliseconds without reading any vtu files again
+#   runs.json        run names, column names and summary column names
+#   lengths.npy      number of timesteps of each run                    (runs)
+#   times.npy        time of each timestep in years, nan padded         (runs x timesteps)
+#   values.npy       every reduction of every timestep, nan padded      (runs x timesteps x columns)
+#   summary.npy      steady state averages of each run                  (runs x summary columns)
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+def pad_series(series, n_columns):
+    # Stack the time series of every run into nan padded arrays
+    # series is a list of arrays with the time in the first column and n_columns after it, one per run
+    # Returns the lengths (runs), times (runs x timesteps) and values (runs x timesteps x columns)
+    lengths = np.array([len(df) for df in series], dtype=np.int64)
+    n_timesteps = lengths.max() if len(lengths) else 0
+
+    times = np.full((len(series), n_timesteps), np.nan)
+    values = np.full((len(series), n_timesteps, n_columns), np.nan)
+    for i, df in enumerate(series):
+        times[i, :len(df)] = df[:, 0]
+        values[i, :len(df)] = df[:, 1:]
+
+    return lengths, times, values
+
+def write_store(store_path, names, series, columns, summary=None, summary_columns=None):
+    # Write the time series of every run to the store, see pad_series
+    os.makedirs(store_path, exist_ok=True)
+    lengths, times, values = pad_series(series, len(columns))
+
+    np.save(os.path.join(store_path, 'lengths.npy'), lengths)
+    np.save(os.path.join(store_path, 'times.npy'), times)
+    np.save(os.path.join(store_path, 'values.npy'), values)
+
+    if summary is not None:
+        np.save(os.path.join(store_path, 'summary.npy'), np.array(summary, dtype=float).reshape(len(series), -1))
+
+    # runs.json is written last, a store without it is incomplete
+    with open(os.path.join(store_path, 'runs.json'), 'w') as file:
+        json.dump({'runs': list(names), 'columns': list(columns), 'summary_columns': list(summary_columns or [])}, file, indent=1)
+
+    print(f"Time series of {len(series)} runs written to {store_path}")
+
+def load_store(store_path, mmap=True):
+    # Load the store, the arrays are memory mapped unless mmap is False
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(store_path, 'runs.json')) as file:
+        store = json.load(file)
+
+    for array in ('lengths', 'times', 'values'):
+        store[array] = np.load(os.path.join(store_path, array + '.npy'), mmap_mode=mmap_mode)
+
+    summary_file = os.path.join(store_path, 'summary.npy')
+    store['summary'] = np.load(summary_file, mmap_mode=mmap_mode) if os.path.isfile(summary_file) else None
+
+    return store
+
+def load_run(store, name):
+    # Time series of one run as a DataFrame, with a Time column then one column per reduction
+    i = store['runs'].index(name)
+    n = store['lengths'][i]
+    df = pd.DataFrame(np.asarray(store['values'][i, :n]), columns=store['columns'])
+    df.insert(0, 'Time', np.asarray(store['times'][i, :n]))
+    return df
+
+def load_summary(store):
+    # Steady state averages of every run as a DataFrame indexed by run name
+    return pd.DataFrame(np.asarray(store['summary']), index=pd.Index(store['runs'], name='Folder Name'), columns=store['summary_columns'])
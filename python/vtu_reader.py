@@ -0,0 +1,188 @@
+# Lightweight reader for the vtu files written by ASPECT
+
+# Only the XML tags are parsed when the file is opened, the data arrays are decoded when they are asked for
+# The file is memory mapped, so arrays that are never asked for (density, viscosity, strain rate, ...)
+# are never decoded and barely read from disk
+# Handles ascii, inline binary (base64) and appended (raw or base64) data, with or without zlib/lzma compression
+# Uncompressed raw appended arrays are returned as zero-copy views of the memory map
+
+import re
+import mmap
+import zlib
+import lzma
+import base64
+import numpy as np
+
+VTK_TYPES = {
+    'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2', 'Int32': 'i4', 'UInt32': 'u4',
+    'Int64': 'i8', 'UInt64': 'u8', 'Float32': 'f4', 'Float64': 'f8',
+}
+
+DECOMPRESSORS = {
+    'vtkZLibDataCompressor': zlib.decompress,
+    'vtkLZMADataCompressor': lzma.decompress,
+}
+
+# Sections of the file whose data arrays are kept track of
+SECTIONS = (b'FieldData', b'PointData', b'CellData', b'Points', b'Cells')
+
+ATTRIBUTE = re.compile(rb'(\w+)="([^"]*)"')
+BASE64_CHUNK = re.compile(rb'[A-Za-z0-9+/]*={0,2}')
+
+def parse_attributes(tag):
+    # Attributes of an XML tag as a dictionary of strings
+    return {key.decode(): value.decode() for key, value in ATTRIBUTE.findall(tag)}
+
+def decode_base64(text):
+    # Decode base64 text that may be several separately padded chunks one after another
+    text = b''.join(text.split())
+    return b''.join(base64.b64decode(chunk) for chunk in BASE64_CHUNK.findall(text) if chunk)
+
+class VTUFile:
+    # Reader for a single vtu file, with the same points/get_point_field interface as vtuIO.VTUIO
+
+    def __init__(self, file_path, dim=2):
+        self.file_path = file_path
+        self.dim = dim
+        with open(file_path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._arrays = {section.decode(): {} for section in SECTIONS}
+        self._appended_start = None
+        self.appended_encoding = None
+        self._parse_header()
+        self._points = None
+
+    def _parse_header(self):
+        # Walk the XML tags, jumping over inline data, and note where each data array is
+        data = self._map
+        pos = data.find(b'<VTKFile')
+        end = data.find(b'>', pos)
+        attributes = parse_attributes(data[pos:end])
+        self.byte_order = '<' if attributes.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+        self.header_type = np.dtype(VTK_TYPES[attributes.get('header_type', 'UInt32')]).newbyteorder(self.byte_order)
+        self.compressor = attributes.get('compressor')
+        if self.compressor is not None and self.compressor not in DECOMPRESSORS:
+            raise ValueError(f"{self.file_path}: unsupported compressor {self.compressor}")
+
+        section = None
+        appended_offsets = set()
+        pos = end
+        while True:
+            pos = data.find(b'<', pos)
+            if pos == -1:
+                break
+            end = data.find(b'>', pos)
+            tag = data[pos + 1:end]
+            name = tag.split(None, 1)[0] if tag else b''
+
+            if name in SECTIONS:
+                section = name.decode()
+            elif name.lstrip(b'/') in SECTIONS:
+                section = None
+            elif name == b'DataArray':
+                attributes = parse_attributes(tag)
+                if attributes.get('format') == 'appended':
+                    appended_offsets.add(int(attributes['offset']))
+                elif not tag.endswith(b'/'):
+                    # Inline data runs up to the next tag, skip straight over it
+                    attributes['start'] = end + 1
+                    end = data.find(b'<', end)
+                    attributes['end'] = end
+                if section is not None:
+                    self._arrays[section][attributes.get('Name', '')] = attributes
+            elif name == b'AppendedData':
+                attributes = parse_attributes(tag)
+                self.appended_encoding = attributes.get('encoding', 'raw')
+                self._appended_start = data.find(b'_', end) + 1
+                break
+            pos = end
+
+        # Each encoded appended array ends where the next one starts, or at the end of the appended data
+        offsets = sorted(appended_offsets)
+        if offsets and self.appended_encoding != 'raw':
+            last = data.find(b'</AppendedData>', self._appended_start)
+            ends = [self._appended_start + offset for offset in offsets[1:]] + [last]
+            self._appended_ends = dict(zip(offsets, ends))
+
+    def _decompress(self, raw, offset=0):
+        # Decompress the blocks of an array whose header starts at offset in raw
+        header_size = self.header_type.itemsize
+        n_blocks = int(np.frombuffer(raw, self.header_type, 1, offset)[0])
+        header = np.frombuffer(raw, self.header_type, 3 + n_blocks, offset).astype(np.int64)
+        block_sizes = header[3:]
+        start = offset + header_size * (3 + n_blocks)
+        decompress = DECOMPRESSORS[self.compressor]
+        blocks = []
+        for size in block_sizes:
+            blocks.append(decompress(raw[start:start + size]))
+            start += size
+        return b''.join(blocks)
+
+    def _read_bytes(self, raw, offset=0):
+        # Bytes of an array whose header starts at offset in raw, a view of raw if it is uncompressed
+        if self.compressor is not None:
+            return self._decompress(raw, offset)
+        header_size = self.header_type.itemsize
+        n_bytes = int(np.frombuffer(raw, self.header_type, 1, offset)[0])
+        return memoryview(raw)[offset + header_size:offset + header_size + n_bytes]
+
+    def read_array(self, section, name):
+        # Decode one data array, arrays with several components come back as (n, components)
+        attributes = self._arrays[section].get(name)
+        if attributes is None:
+            raise KeyError(f"{self.file_path}: no {section} array named {name}")
+
+        dtype = np.dtype(VTK_TYPES[attributes['type']]).newbyteorder(self.byte_order)
+        data_format = attributes.get('format', 'ascii')
+
+        if data_format == 'ascii':
+            array = np.array(self._map[attributes['start']:attributes['end']].split(), dtype=dtype)
+        elif data_format == 'binary':
+            array = np.frombuffer(self._read_bytes(decode_base64(self._map[attributes['start']:attributes['end']])), dtype)
+        elif data_format == 'appended':
+            start = self._appended_start + int(attributes['offset'])
+            if self.appended_encoding == 'raw':
+                array = np.frombuffer(self._read_bytes(self._map, start), dtype)
+            else:
+                # Encoded arrays run up to the start of the next one
+                end = self._appended_ends[int(attributes['offset'])]
+                array = np.frombuffer(self._read_bytes(decode_base64(self._map[start:end])), dtype)
+        else:
+            raise ValueError(f"{self.file_path}: unknown data array format {data_format}")
+
+        n_components = int(attributes.get('NumberOfComponents', 1))
+        if n_components > 1:
+            array = array.reshape(-1, n_components)
+        return array
+
+    @property
+    def points(self):
+        # Coordinates of the mesh points, only the first dim components
+        if self._points is None:
+            points = self.read_array('Points', next(iter(self._arrays['Points'])))
+            self._points = points[:, :self.dim]
+        return self._points
+
+    @property
+    def point_field_names(self):
+        return list(self._arrays['PointData'])
+
+    def get_point_field(self, name):
+        return self.read_array('PointData', name)
+
+    def get_cell_field(self, name):
+        return self.read_array('CellData', name)
+
+    def get_field_data(self, name):
+        # Field data of the whole file, such as the TIME deal.II stores
+        return self.read_array('FieldData', name)
+
+    def get_cells(self):
+        # Connectivity, offsets and types of the cells
+        return tuple(self.read_array('Cells', name) for name in ('connectivity', 'offsets', 'types'))
+
+    def close(self):
+        # Release the memory map, so the file can be deleted or replaced (Windows refuses while it is mapped)
+        # Arrays returned as views of the map have to be dropped or copied first, or this raises BufferError
+        self._points = None
+        self._map.close()
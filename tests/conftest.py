@@ -0,0 +1,5 @@
+# The analysis scripts are plain modules in python/, put them on the path of the tests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
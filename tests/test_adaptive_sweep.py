@@ -0,0 +1,65 @@
+# adaptive_sweep.next_batch on a sweep part way through, with no runs finished and with every queued run finished
+
+import os
+import numpy as np
+import pandas as pd
+import script_maker
+import timeseries_store
+import adaptive_sweep
+
+COLUMN = 'T 100-200km R'
+
+# one row per variable, one column per level, as script_maker reads input_file
+LEVELS = np.array([[7500000, 15000000, 30000000],
+                   [0.01, 0.02, 0.03],
+                   [1350, 1400, 1450],
+                   [1, 5, 10],
+                   [30000, 60000, 100000]], dtype=float)
+
+def start_sweep(folder, n_runs):
+    # Manifest and permutations.csv of the first n_runs runs of the full design, with their .prm files
+    permutations =[[LEVELS[0][i % 3], LEVELS[1][i % 3] * (-1)**i, LEVELS[2][i // 3 % 3], 5, 30000] for i in range(n_runs)]
+    prm_folder = os.path.join(folder, 'prm')
+    os.makedirs(prm_folder)
+    results = script_maker.process_all(permutations, prm_folder)
+    manifest_file = os.path.join(folder, 'manifest.csv')
+    permutations_file = os.path.join(folder, 'permutations.csv')
+    script_maker.write_manifest(manifest_file, permutations, results)
+    script_maker.write_to_csv(permutations_file, [[index] + perm for index, perm in enumerate(permutations, start=1)])
+    return manifest_file, permutations_file, prm_folder
+
+def write_results(store_path, names):
+    # Store with a steady state temperature for each run in names
+    series = [np.column_stack([np.arange(3.0), np.full(3, 500.0)]) for name in names]
+    summary = [[400.0 + 10 * np.sin(i)] for i in range(len(names))]
+    timeseries_store.write_store(store_path, names, series, ['T'], summary, [COLUMN])
+
+def batch(folder, batch_size=4):
+    manifest_file, permutations_file, prm_folder = start_sweep(folder, 8)
+    return manifest_file, permutations_file, prm_folder, lambda: adaptive_sweep.next_batch(
+        LEVELS, manifest_file, permutations_file, os.path.join(folder, 'timeseries'), prm_folder, COLUMN, batch_size)
+
+def test_every_run_finished(tmp_path):
+    # No run of the manifest is pending, the batch is chosen from the finished runs alone
+    manifest_file, permutations_file, prm_folder, next_batch = batch(str(tmp_path))
+    write_results(os.path.join(str(tmp_path), 'timeseries'), list(pd.read_csv(manifest_file)['Output Directory']))
+
+    assert next_batch() == (9, 12)
+    manifest = pd.read_csv(manifest_file)
+    assert list(manifest['Index']) == list(range(1, 13))
+    assert all(os.path.isfile(os.path.join(prm_folder, name)) for name in manifest['File'])
+    variables = [name for name in manifest.columns if name.startswith('Variable_')]
+    assert len({tuple(run) for run in manifest[variables].to_numpy()}) == 12
+
+    # The slurm jobs cover the new runs alone
+    jobs = pd.read_csv(os.path.join(prm_folder, 'job_manifest.csv'))
+    assert sorted(jobs['Index']) == list(range(9, 13))
+    assert all(os.path.isfile(os.path.join(prm_folder, script)) for script in jobs['Script'])
+
+def test_no_run_finished(tmp_path):
+    # Nothing to fit to yet, every run of the manifest is pending
+    manifest_file, permutations_file, prm_folder, next_batch = batch(str(tmp_path))
+    write_results(os.path.join(str(tmp_path), 'timeseries'), ['another_sweep'])
+
+    assert next_batch() == (9, 12)
+    assert len(pd.read_csv(manifest_file)) == 12
@@ -0,0 +1,116 @@
+# steady_monitor replayed over recorded runs, checked against the steady state the analysis finds
+
+import os
+import numpy as np
+import steady_state
+import steady_monitor
+import aspect_output
+import paraview_output_split_combine as pipeline
+
+WIDTH = 15000000.0
+HEIGHT = 3000000.0
+N_OUTPUTS = 80
+
+def write_vtu(file_path, points, T):
+    # An ascii vtu file laid out as ASPECT writes them, with the temperature as its only point field
+    def values(array):
+        return ' '.join(repr(float(value)) for value in np.ravel(array))
+    with open(file_path, 'w') as file:
+        file.write('<?xml version="1.0"?>\n'
+                   '<VTKFile type="UnstructuredGrid" version="0.1" byte_order="LittleEndian">\n'
+                   '<UnstructuredGrid>\n'
+                   f'<Piece NumberOfPoints="{len(points)}" NumberOfCells="0">\n'
+                   '<PointData Scalars="T">\n'
+                   f'<DataArray type="Float64" Name="T" format="ascii">{values(T)}</DataArray>\n'
+                   '</PointData>\n'
+                   '<Points>\n'
+                   f'<DataArray type="Float64" NumberOfComponents="3" format="ascii">{values(points)}</DataArray>\n'
+                   '</Points>\n'
+                   '</Piece>\n'
+                   '</UnstructuredGrid>\n'
+                   '</VTKFile>\n')
+
+def record_run(run_folder, left, right, interval=steady_monitor.OUTPUT_INTERVAL):
+    # Output directory of a run whose temperature is left[n] on the L side and right[n] on the R side at output n
+    os.makedirs(os.path.join(run_folder, 'solution'))
+    x, y = np.meshgrid(np.linspace(0, WIDTH, 11), np.linspace(0, HEIGHT, 61))
+    points = np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size)])
+    on_left = points[:, 0] <= 2 * WIDTH / 3
+
+    datasets = []
+    for n, (T_left, T_right) in enumerate(zip(left, right)):
+        file_name = f'solution/solution-{n:05d}.0000.vtu'
+        write_vtu(os.path.join(run_folder, file_name), points, np.where(on_left, T_left, T_right))
+        datasets.append(f'<DataSet timestep="{n * interval}" group="" part="0" file="{file_name}"/>')
+    with open(os.path.join(run_folder, 'solution.pvd'), 'w') as file:
+        file.write('<?xml version="1.0"?>\n<VTKFile type="Collection" version="0.1">\n<Collection>\n'
+                   + '\n'.join(datasets) + '\n</Collection>\n</VTKFile>\n')
+    return run_folder
+
+def settling(n, start, end, scale):
+    return end + (start - end) * np.exp(-n / scale)
+
+def test_replay_stops_once_the_analysis_series_are_steady(tmp_path):
+    n = np.arange(N_OUTPUTS)
+    run_folder = record_run(str(tmp_path / 'run'), settling(n, 2000, 1500, 4), settling(n, 2200, 1600, 12))
+
+    run = steady_monitor.SteadyStateMonitor(run_folder)
+    run.update()
+    times, values = run.series()
+
+    # The monitor sees the same L and R series the analysis reduces the files to
+    spec = {'bands': [(100, 200), (200, 400)], 'fields': ['T'], 'regions': ['L', 'R'], 'weights': None}
+    analysis = pipeline.process_vtu_files(aspect_output.timestep_index(run_folder), spec)
+    assert run.labels == pipeline.reduction_columns(spec)
+    np.testing.assert_allclose(values.T, analysis[:, 1:])
+
+    stop_time, end_time = steady_monitor.replay(run_folder)
+    assert stop_time is not None and end_time == times[-1]
+
+    # Every series is past the onset the analysis finds from the whole run when the monitor stops it
+    onset, reached = steady_state.find_steady_state(analysis[:, 1:].T)
+    stop = int(np.flatnonzero(times == stop_time)[0])
+    assert reached.all()
+    assert (stop + 1 - onset >= run.hold).all()
+
+def test_drifting_right_side_is_not_stopped(tmp_path):
+    # The L side settles but the subcontinental R side keeps warming faster than the threshold
+    n = np.arange(N_OUTPUTS)
+    run_folder = record_run(str(tmp_path / 'run'), settling(n, 2000, 1500, 4), 1400 + 2 * steady_state.THRESHOLD * n)
+
+    stop_time, end_time = steady_monitor.replay(run_folder)
+    assert stop_time is None
+
+def test_transient_calm_spot_is_not_stopped(tmp_path):
+    # R pauses for a few outputs after MIN_START, long enough for the criterion, then carries on drifting
+    n = np.arange(N_OUTPUTS)
+    right = 1400 + 2 * steady_state.THRESHOLD * np.where(n < 30, n, np.where(n < 36, 30, n - 6))
+    run_folder = record_run(str(tmp_path / 'run'), settling(n, 2000, 1500, 4), right)
+
+    run = steady_monitor.SteadyStateMonitor(run_folder)
+    run.update()
+    times, values = run.series()
+    onset, reached = steady_state.find_steady_state(values)
+    assert reached.all()
+
+    stop_time, end_time = steady_monitor.replay(run_folder)
+    assert stop_time is None
+
+def test_half_written_output_is_read_again(tmp_path, monkeypatch):
+    # A poll that catches solution.pvd half way through being rewritten tries again at the next check
+    n = np.arange(N_OUTPUTS)
+    run_folder = record_run(str(tmp_path / 'run'), settling(n, 2000, 1500, 4), settling(n, 2200, 1600, 12))
+    pvd_file = os.path.join(run_folder, 'solution.pvd')
+    with open(pvd_file) as file:
+        pvd = file.read()
+    with open(pvd_file, 'w') as file:
+        file.write(pvd[:len(pvd) // 2])
+
+    def finish_writing(seconds):
+        with open(pvd_file, 'w') as file:
+            file.write(pvd)
+    monkeypatch.setattr(steady_monitor.time, 'sleep', finish_writing)
+
+    stop_time = steady_monitor.monitor(run_folder, poll_seconds=0)
+    assert stop_time == (N_OUTPUTS - 1) * steady_monitor.OUTPUT_INTERVAL
+    assert os.path.isfile(os.path.join(run_folder, steady_monitor.STOP_FILE))